@@ -0,0 +1,124 @@
+import numpy as np
+
+from event_store import SENTIMENT_CODES, SENTIMENT_TYPES
+from trend import detect_start_ts, trend_rows
+
+# 报表聚合：对列式事件库做一次聚合，填好所有 stat_* 报表需要的累加器，
+# 各报表只负责从累加器渲染 CSV，不再各自回扫弹幕/礼物
+
+
+def seq_sum(values):
+    """按顺序逐项累加（与 Python 循环 += 的舍入完全一致，np.sum 的成对求和在末位可能不同）"""
+    return float(np.cumsum(values)[-1]) if len(values) else 0.0
+
+
+def top_k(values, first, k):
+    """按 values 降序取前 k 组，相同值按首次出现先后（与 sorted(..., reverse=True)[:k] 一致）。
+    先用 partition 选出不小于第 k 大值的候选（O(n)），只对候选排序。"""
+    n = len(values)
+    if n > k:
+        kth = np.partition(values, n - k)[n - k]
+        candidates = np.flatnonzero(values >= kth)
+    else:
+        candidates = np.arange(n)
+    order = np.lexsort((first[candidates], -values[candidates]))[:k]
+    return candidates[order]
+
+
+class GroupIndex:
+    """按编码分组：一次稳定排序得到每组成员在原序列中的位置（组内保持原顺序）。
+    keep_members=False 时只保留每组的计数与首末位置，内存与组数成正比。"""
+
+    def __init__(self, codes, keep_members=True):
+        n = len(codes)
+        order = np.argsort(codes, kind='stable')
+        sorted_codes = codes[order]
+        if n:
+            starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+        else:
+            starts = np.empty(0, dtype=np.int64)
+        ends = np.r_[starts[1:], n].astype(np.int64)
+        self.keys = sorted_codes[starts]
+        self.counts = ends - starts
+        self.first = order[starts]
+        self.last = order[ends - 1] if n else np.empty(0, dtype=np.int64)
+        self.order = self.starts = self.ends = None
+        if keep_members:
+            self.order, self.starts, self.ends = order, starts, ends
+
+    def __len__(self):
+        return len(self.keys)
+
+    def find(self, code):
+        """编码对应的组序号"""
+        return int(np.searchsorted(self.keys, code))
+
+    def members(self, group):
+        return self.order[self.starts[group]:self.ends[group]]
+
+
+class UserTextCounts:
+    """每个用户的弹幕频率：按 (uid, 文本编码) 去重计数。
+    内存与不同的 (用户, 文本) 对数成正比，而不是与消息条数成正比；结果为精确计数。"""
+
+    def __init__(self, uid_codes, text_codes, n_texts):
+        n_texts = max(n_texts, 1)
+        keys = uid_codes.astype(np.int64) * n_texts + text_codes
+        pairs, self.first, self.count = np.unique(keys, return_index=True, return_counts=True)
+        # np.unique 的结果按 uid 再按文本编码有序，每个用户占一段连续区间
+        self.uid = pairs // n_texts
+        self.text = (pairs % n_texts).astype(np.int32)
+
+    def __len__(self):
+        return len(self.count)
+
+    def most_common(self, uid_code):
+        """与 Counter(该用户所有弹幕).most_common() 相同顺序的 (文本编码, 次数) 列表：
+        次数降序，次数相同按首次出现先后"""
+        lo, hi = np.searchsorted(self.uid, [uid_code, uid_code + 1])
+        order = np.lexsort((self.first[lo:hi], -self.count[lo:hi]))
+        return list(zip(self.text[lo:hi][order].tolist(), self.count[lo:hi][order].tolist()))
+
+
+class ReportAggregates:
+
+    def __init__(self, store, trend_start_ts, trend_steps):
+        d = store.danmaku
+        g = store.gift
+
+        # 弹幕：按 uid 分组（发送人数、发送量、最后使用的用户名），弹幕频率按 (uid, 文本) 去重计数
+        self.danmaku_users = GroupIndex(d['uid'], keep_members=False)
+        self.user_texts = UserTextCounts(d['uid'], d['text'], len(store.texts))
+
+        # 礼物：总价值（含/不含 SC）、送礼人数、按 uid 的贡献
+        gift_values = store.gift_values()
+        is_sc = g['giftname'] == store.giftnames.lookup('醒目留言')
+        self.sc_value = seq_sum(gift_values[is_sc])
+        self.sc_count = int(is_sc.sum())
+        self.gift_value_no_sc = seq_sum(gift_values[~is_sc])
+        self.gift_senders = len(np.unique(g['uid'][~is_sc]))
+        self.gift_users = GroupIndex(g['uid'])
+        # bincount 按记录顺序逐项累加，与逐条 += 一致
+        self.gift_totals = np.bincount(g['uid'], weights=gift_values, minlength=len(store.uids))[self.gift_users.keys]
+
+        sc_idx = np.flatnonzero(is_sc)
+        self.sc_order = sc_idx[np.argsort(-g['price'][sc_idx], kind='stable')]
+
+        # 情感
+        effective_idx = store.effective_indices()
+        self.effective_count = len(effective_idx)
+        types = store.sentiment_type[effective_idx]
+        self.sentiment_counts = dict(zip(SENTIMENT_TYPES, np.bincount(types, minlength=len(SENTIMENT_TYPES)).tolist()))
+        self.score_sum = seq_sum(store.sentiment_score[effective_idx])
+        eff_uids = d['uid'][effective_idx]
+        self.sentiment_users = {name: GroupIndex(eff_uids[types == code]) for name, code in SENTIMENT_CODES.items()}
+
+        # 趋势
+        d_ts = d['timestamp']
+        g_ts = g['timestamp']
+        if trend_start_ts is None:
+            trend_start_ts = detect_start_ts(np.concatenate([d_ts, g_ts]), trend_steps[0])
+        self.trend_start_ts = trend_start_ts
+        self.trend = None
+        if trend_start_ts is not None:
+            self.trend = trend_rows(d_ts, d_ts[effective_idx], types, g_ts, gift_values, trend_start_ts, trend_steps)
@@ -0,0 +1,150 @@
+import hashlib
+import json
+import mmap
+import os
+
+import numpy as np
+
+from event_store import EventStore
+
+# 解析缓存：把解析后的列式事件库写成二进制文件放在 XML 旁边（input.xml -> input.xml.cache），
+# 加载时内存映射，数值列直接指向映射内存，不再解析 XML。
+# 以源文件的大小、mtime 与 sha1 为键，任一项变化即失效。缓存的是过滤前的原始事件，调整过滤规则不影响缓存。
+#
+# 文件布局：MAGIC | 头部长度(u64) | JSON 头部 | 各数组（按 8 字节对齐）
+# 字典表（文本/uid/用户名/礼物名）存为 '\0' 分隔的 UTF-8 串（XML 中不可能出现 \0）加一个空值标记数组
+
+MAGIC = b'HSRDMK01'
+CACHE_SUFFIX = '.cache'
+CATEGORICALS = ('texts', 'uids', 'users', 'giftnames')
+
+
+def cache_path_for(xml_path):
+    return xml_path + CACHE_SUFFIX
+
+
+def file_sha1(path):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def source_key(xml_path, with_hash=True):
+    st = os.stat(xml_path)
+    key = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+    if with_hash:
+        key['sha1'] = file_sha1(xml_path)
+    return key
+
+
+def encode_strings(values):
+    """字符串表（可含 None）-> (空值标记数组, '\\0' 分隔的 UTF-8 字节数组)"""
+    nulls = np.array([v is None for v in values], dtype=np.uint8)
+    blob = '\0'.join('' if v is None else v for v in values).encode('utf-8')
+    return nulls, np.frombuffer(blob, dtype=np.uint8)
+
+
+def decode_strings(nulls, blob):
+    if not len(nulls):
+        return []
+    values = bytes(blob).decode('utf-8').split('\0')
+    for i in np.flatnonzero(nulls).tolist():
+        values[i] = None
+    return values
+
+
+def store_arrays(store):
+    """事件库的列与字典表 -> 扁平的 {名字: 数组}"""
+    arrays = {}
+    for name, col in store.danmaku.items():
+        arrays[f'danmaku.{name}'] = col
+    for name, col in store.gift.items():
+        arrays[f'gift.{name}'] = col
+    for name in CATEGORICALS:
+        nulls, blob = encode_strings(getattr(store, name).values)
+        arrays[f'{name}.nulls'] = nulls
+        arrays[f'{name}.blob'] = blob
+    return arrays
+
+
+def store_from_arrays(arrays):
+    danmaku = {k.split('.', 1)[1]: v for k, v in arrays.items() if k.startswith('danmaku.')}
+    gift = {k.split('.', 1)[1]: v for k, v in arrays.items() if k.startswith('gift.')}
+    tables = {name: decode_strings(arrays[f'{name}.nulls'], arrays[f'{name}.blob']) for name in CATEGORICALS}
+    return EventStore.from_columns(danmaku, gift, **tables)
+
+
+def write_arrays(path, header, arrays, magic=MAGIC):
+    """按文件布局写出 header（JSON）与各数组，先写临时文件再替换"""
+    layout = {}
+    offset = 0
+    for name, arr in arrays.items():
+        offset = (offset + 7) // 8 * 8
+        layout[name] = {'dtype': arr.dtype.str, 'offset': offset, 'count': len(arr)}
+        offset += arr.nbytes
+    header = json.dumps(dict(header, arrays=layout)).encode('utf-8')
+    data_start = (len(magic) + 8 + len(header) + 7) // 8 * 8
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(magic)
+        f.write(len(header).to_bytes(8, 'little'))
+        f.write(header)
+        for name, arr in arrays.items():
+            f.seek(data_start + layout[name]['offset'])
+            f.write(np.ascontiguousarray(arr).tobytes())
+        # 末尾补齐到 8 字节，保证空数组的偏移也落在文件内
+        f.truncate(data_start + (offset + 7) // 8 * 8)
+    os.replace(tmp_path, path)
+
+
+def read_header(f, magic=MAGIC):
+    """从文件开头读取 JSON 头部，魔数不符时返回 None"""
+    if f.read(len(magic)) != magic:
+        return None
+    header_len = int.from_bytes(f.read(8), 'little')
+    return json.loads(f.read(header_len))
+
+
+def map_arrays(f, header, magic=MAGIC):
+    """内存映射刚读完头部的同一文件（f 的位置在头部末尾），返回 {名字: 指向映射内存的数组}"""
+    header_len = f.tell() - len(magic) - 8
+    mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    data_start = (len(magic) + 8 + header_len + 7) // 8 * 8
+    return {name: np.frombuffer(mm, dtype=np.dtype(info['dtype']), count=info['count'],
+                                offset=data_start + info['offset'])
+            for name, info in header['arrays'].items()}
+
+
+def save(store, xml_path, key=None):
+    """写出解析缓存（先写临时文件再替换）"""
+    key = key or source_key(xml_path)
+    path = cache_path_for(xml_path)
+    write_arrays(path, {'source': key}, store_arrays(store))
+    print(f"解析缓存已写入: {path}")
+
+
+def load(xml_path, verify_hash=True):
+    """缓存有效时返回内存映射的 EventStore，否则返回 None"""
+    path = cache_path_for(xml_path)
+    if not os.path.exists(path) or not os.path.exists(xml_path):
+        return None
+    with open(path, 'rb') as f:
+        header = read_header(f)
+        if header is None:
+            return None
+
+        cached = header['source']
+        key = source_key(xml_path, with_hash=False)
+        if cached['size'] != key['size'] or cached['mtime_ns'] != key['mtime_ns']:
+            print("解析缓存已过期（源文件大小或修改时间变化），重新解析。")
+            return None
+        if verify_hash and cached['sha1'] != file_sha1(xml_path):
+            print("解析缓存已过期（源文件内容变化），重新解析。")
+            return None
+        arrays = map_arrays(f, header)
+
+    print(f"已从解析缓存加载: {path}")
+    return store_from_arrays(arrays)
@@ -0,0 +1,162 @@
+import argparse
+import contextlib
+import csv
+import glob
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from main import MODEL_PATH, SENTIMENT_BACKEND, SENTIMENT_CACHE_SIZE, SENTIMENT_DISK_CACHE, BilibiliLiveAnalyzer
+from sentiment_cache import SentimentCache, sentiment_model
+
+# 批量分析：对一个目录 / 通配符下的所有录播 XML 分别运行完整分析，每场一个工作进程、一个输出目录，
+# 最后汇总成跨场次的总表。已有结果且比输入新的场次会被跳过（断点续跑）。
+#   python batch.py recordings/ --workers 4
+#   python batch.py "recordings/2025-*.xml" --output batch_output --force
+
+# ================= 配置区域 =================
+BATCH_OUTPUT_FOLDER = 'batch_output'
+SUMMARY_FILENAME = 'summary.json'       # 每场直播输出目录中的汇总（同时作为完成标记）
+# ==========================================
+
+SUMMARY_HEADERS = ['直播', '总弹幕数', '弹幕发送人数', '有效弹幕数', '积极数量', '中性数量', '消极数量',
+                   '平均情感置信度', '礼物总价值(无SC)', '送礼人数', 'SC总价值', 'SC总数量']
+
+
+def find_inputs(patterns):
+    """目录取其下所有 .xml，其余按通配符展开；去重并排序"""
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            paths += glob.glob(os.path.join(pattern, '*.xml'))
+        else:
+            paths += glob.glob(pattern)
+    return sorted(set(os.path.normpath(p) for p in paths))
+
+
+def stream_name(xml_path):
+    return os.path.splitext(os.path.basename(xml_path))[0]
+
+
+def stream_summary(name, tool):
+    """从分析器的聚合结果提取一行跨场次汇总"""
+    agg = tool.aggregates
+    c = agg.sentiment_counts
+    avg_score = agg.score_sum / agg.effective_count if agg.effective_count else 0.0
+    return {
+        '直播': name,
+        '总弹幕数': tool.store.n_danmaku,
+        '弹幕发送人数': len(agg.danmaku_users),
+        '有效弹幕数': agg.effective_count,
+        '积极数量': c['positive'],
+        '中性数量': c['neutral'],
+        '消极数量': c['negative'],
+        '平均情感置信度': round(avg_score, 4),
+        '礼物总价值(无SC)': round(agg.gift_value_no_sc, 2),
+        '送礼人数': agg.gift_senders,
+        'SC总价值': round(agg.sc_value, 2),
+        'SC总数量': agg.sc_count,
+    }
+
+
+def is_up_to_date(xml_path, out_dir):
+    summary_path = os.path.join(out_dir, SUMMARY_FILENAME)
+    return os.path.exists(summary_path) and os.path.getmtime(summary_path) > os.path.getmtime(xml_path)
+
+
+def read_summary(out_dir):
+    with open(os.path.join(out_dir, SUMMARY_FILENAME), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def analyze_stream(xml_path, out_dir):
+    """在工作进程中分析单场直播，日志写入该场的 run.log，返回 (汇总行, 耗时, 新推理的情感分数)。
+    各工作进程只读磁盘情感缓存，新分数交给主进程合并后统一保存（多个进程同时写同一缓存文件会互相覆盖）"""
+    os.makedirs(out_dir, exist_ok=True)
+    started = time.time()
+    with open(os.path.join(out_dir, 'run.log'), 'w', encoding='utf-8') as log, contextlib.redirect_stdout(log):
+        # 每场直播开始时间不同，趋势起点自动检测
+        tool = BilibiliLiveAnalyzer(xml_path, out_dir, trend_start_ts=None)
+        tool.sentiment_cache = SentimentCache(MODEL_PATH, SENTIMENT_CACHE_SIZE, SENTIMENT_DISK_CACHE, tool.backend,
+                                              read_only=True)
+        tool.run_all()
+        summary = stream_summary(stream_name(xml_path), tool)
+    # 汇总最后写入，作为该场已完成的标记
+    with open(os.path.join(out_dir, SUMMARY_FILENAME), 'w', encoding='utf-8') as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+    return summary, time.time() - started, tool.sentiment_cache.new_scores
+
+
+def run_batch(patterns, output_folder=BATCH_OUTPUT_FOLDER, workers=None, force=False):
+    inputs = find_inputs(patterns)
+    if not inputs:
+        print("没有找到任何 XML 录播文件。")
+        return []
+
+    names = [stream_name(p) for p in inputs]
+    if len(set(names)) != len(names):
+        raise ValueError("存在同名录播文件，无法区分输出目录，请分批处理。")
+
+    summaries = {}
+    pending = []
+    for xml_path, name in zip(inputs, names):
+        out_dir = os.path.join(output_folder, name)
+        if not force and is_up_to_date(xml_path, out_dir):
+            summaries[name] = read_summary(out_dir)
+            print(f"跳过（结果已是最新）: {xml_path}")
+        else:
+            pending.append((xml_path, out_dir))
+
+    print(f"共 {len(inputs)} 场直播，待分析 {len(pending)} 场，跳过 {len(inputs) - len(pending)} 场。")
+    failed = []
+    scores = {}
+    if pending:
+        # 先在主进程加载情感模型：进程池以 fork 启动时各工作进程直接共享这份模型，
+        # 以 spawn 启动时每个工作进程在第一场直播时加载一次，之后复用
+        sentiment_model(MODEL_PATH)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(analyze_stream, xml_path, out_dir): xml_path for xml_path, out_dir in pending}
+            for future in as_completed(futures):
+                xml_path = futures[future]
+                try:
+                    summary, elapsed, new_scores = future.result()
+                except Exception as e:
+                    failed.append(xml_path)
+                    print(f"分析失败: {xml_path} ({e})")
+                    continue
+                summaries[summary['直播']] = summary
+                scores.update(new_scores)
+                print(f"完成: {xml_path}，耗时 {elapsed:.1f} 秒")
+        if SENTIMENT_DISK_CACHE and scores:
+            cache = SentimentCache(MODEL_PATH, SENTIMENT_CACHE_SIZE, True, SENTIMENT_BACKEND)
+            cache.merge(scores)
+            cache.save()
+
+    rows = [[summaries[name][h] for h in SUMMARY_HEADERS] for name in names if name in summaries]
+    os.makedirs(output_folder, exist_ok=True)
+    path = os.path.join(output_folder, '跨场次汇总.csv')
+    with open(path, 'w', newline='', encoding='utf-8-sig') as f:
+        writer = csv.writer(f)
+        writer.writerow(SUMMARY_HEADERS)
+        writer.writerows(rows)
+    print(f"已生成: {path}")
+    if failed:
+        print(f"以下 {len(failed)} 场分析失败，可修复后重新运行（已完成的场次会自动跳过）:")
+        for xml_path in failed:
+            print(f"  {xml_path}")
+    return rows
+
+
+def main():
+    ap = argparse.ArgumentParser(description='批量分析多场直播录播')
+    ap.add_argument('inputs', nargs='+', help='录播目录或通配符，如 recordings/ 或 "recordings/*.xml"')
+    ap.add_argument('--output', default=BATCH_OUTPUT_FOLDER)
+    ap.add_argument('--workers', type=int, default=None, help='工作进程数，默认 CPU 核数')
+    ap.add_argument('--force', action='store_true', help='忽略已有结果，全部重新分析')
+    args = ap.parse_args()
+    run_batch(args.inputs, args.output, args.workers, args.force)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,209 @@
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import tempfile
+import time
+
+import synth_archive
+from instrument import StageRecorder, peak_rss_mb
+
+# 基准测试：用合成录播（synth_archive.py）分别对 main.py 与 wordcloudg.py 的每个阶段计时并记录峰值内存，
+# 结果写成 JSON，可在不同提交之间对比。
+#   python bench.py                                 # 默认规模 10k/100k/1M/5M
+#   python bench.py --sizes 10k 100k --backend batch
+#   python bench.py --compare bench_results/a.json bench_results/b.json
+#
+# 每个规模在单独的子进程（spawn）中运行，进程峰值内存互不影响；合成录播生成一次后缓存在 BENCH_DATA_FOLDER。
+# 需要在能正常运行 main.py 的目录下执行（情感模型按 main.MODEL_PATH 加载）。
+
+# ================= 配置区域 =================
+DEFAULT_SIZES = ['10k', '100k', '1m', '5m']
+BENCH_DATA_FOLDER = 'bench_data'        # 合成录播缓存目录
+BENCH_RESULTS_FOLDER = 'bench_results'  # 结果 JSON 目录
+SEED = 0
+# ==========================================
+
+ANALYZER_STAGES = ['stat_overview', 'stat_top_danmaku_users', 'stat_top_gift_users', 'stat_all_sc',
+                   'stat_effective_count', 'stat_sentiment_overview', 'stat_sentiment_users', 'stat_time_trend',
+                   'export_debug_files']
+
+
+def parse_size(text):
+    text = text.lower()
+    scale = {'k': 1000, 'm': 1000000}.get(text[-1])
+    return int(float(text[:-1]) * scale) if scale else int(text)
+
+
+def archive_for(n, seed=SEED, folder=BENCH_DATA_FOLDER):
+    """返回规模 n 的合成录播路径，不存在时生成"""
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, f'synth_{n}_{seed}.xml')
+    if not os.path.exists(path):
+        print(f"生成合成录播: {path} ...")
+        synth_archive.generate(path, n, seed)
+    return path
+
+
+def git_revision():
+    """被测代码（本脚本所在仓库）的提交号与是否有未提交改动"""
+    repo = os.path.dirname(os.path.abspath(__file__))
+    try:
+        rev = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=repo, capture_output=True, text=True,
+                             check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=repo,
+                                    capture_output=True, text=True, check=True).stdout.strip())
+        return rev, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+def run_one(xml_path, n, backend, workers, trace_memory, font_path):
+    """在子进程中跑一个规模：依次执行两个脚本的每个阶段，返回结果字典（脚本自身的输出写入日志文件）"""
+    os.environ.setdefault('MPLBACKEND', 'Agg')
+    recorder = StageRecorder(trace_memory=trace_memory)
+    timer = recorder.stage
+    out_dir = tempfile.mkdtemp(prefix='bench_')
+    with open(os.path.join(out_dir, 'run.log'), 'w', encoding='utf-8') as log, contextlib.redirect_stdout(log):
+        with timer('import'):
+            import main
+            import sentiment_cache
+            import wordcloudg
+        if backend == 'snownlp':
+            # 情感模型按需加载，单独计时，不混入 process_data
+            with timer('load_sentiment_model'):
+                sentiment_cache.sentiment_model(main.MODEL_PATH)
+        # 关闭跨运行的磁盘缓存，每次都是冷启动，结果可比
+        main.SENTIMENT_DISK_CACHE = False
+        wordcloudg.ARCHIVE_CACHE = False
+        wordcloudg.HEADLESS = True
+        wordcloudg.OUTPUT_FOLDER = os.path.join(out_dir, 'wc_output')
+
+        tool = main.BilibiliLiveAnalyzer(xml_path, os.path.join(out_dir, 'output'), workers=workers, backend=backend)
+        with timer('analyzer.load_and_parse'):
+            tool.load_and_parse(use_cache=False)
+        with timer('analyzer.archive_cache_save'):
+            main.archive_cache.save(tool.store, xml_path)
+        with timer('analyzer.archive_cache_load'):
+            tool.store = main.archive_cache.load(xml_path)
+        os.remove(main.archive_cache.cache_path_for(xml_path))
+        with timer('analyzer.process_data'):
+            tool.process_data()
+        for name in ANALYZER_STAGES:
+            with timer(f'analyzer.{name}'):
+                getattr(tool, name)()
+        result = {'n_danmaku': tool.store.n_danmaku, 'n_gift': tool.store.n_gift,
+                  'n_effective': int(tool.store.effective.sum()), 'n_texts': len(tool.store.texts)}
+        del tool
+
+        wc = wordcloudg.BiliDanmakuWordCloud(xml_path, workers=workers)
+        with timer('wordcloud.load_data'):
+            wc.load_data()
+        with timer('wordcloud.process_text'):
+            counts = wc.process_text()
+        if font_path is None and not os.path.exists(wordcloudg.FONT_PATH):
+            # 没有配置中文字体时用 wordcloud 自带字体（字形不对，但排版与渲染的工作量相同）
+            from wordcloud.wordcloud import FONT_PATH as font_path
+        if font_path is not None:
+            wordcloudg.FONT_PATH = font_path
+        with timer('wordcloud.generate_wordcloud'):
+            wc.generate_wordcloud(counts)
+
+    result.update({
+        'size': n,
+        'archive_bytes': os.path.getsize(xml_path),
+        'stages': recorder.stages,
+        'total_seconds': round(sum(s['wall_seconds'] for s in recorder.stages), 4),
+        'rss_peak_mb': peak_rss_mb(),
+        'font_path': wordcloudg.FONT_PATH,
+        'log': os.path.join(out_dir, 'run.log'),
+    })
+    return result
+
+
+def run_bench(sizes, backend='snownlp', workers=1, trace_memory=False, font_path=None, seed=SEED):
+    rev, dirty = git_revision()
+    report = {
+        'meta': {
+            'git_revision': rev,
+            'git_dirty': dirty,
+            'started_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'backend': backend,
+            'workers': workers,
+            'trace_memory': trace_memory,
+            'seed': seed,
+        },
+        'results': [],
+    }
+    ctx = multiprocessing.get_context('spawn')
+    for n in sizes:
+        xml_path = archive_for(n, seed)
+        print(f"规模 {n}: 运行中 ...")
+        with ctx.Pool(1) as pool:
+            result = pool.apply(run_one, (xml_path, n, backend, workers, trace_memory, font_path))
+        report['results'].append(result)
+        print(f"规模 {n}: 总耗时 {result['total_seconds']:.2f} 秒，峰值内存 {result['rss_peak_mb']} MB")
+        for stage in result['stages']:
+            print(f"  {stage['name']:<36}{stage['wall_seconds']:>10.3f} s{stage['rss_peak_mb']!s:>10} MB")
+    return report
+
+
+def compare(old_path, new_path):
+    """按 (规模, 阶段) 对比两份结果，打印耗时与峰值内存的变化"""
+    with open(old_path, 'r', encoding='utf-8') as f:
+        old = json.load(f)
+    with open(new_path, 'r', encoding='utf-8') as f:
+        new = json.load(f)
+    old_results = {r['size']: r for r in old['results']}
+    print(f"旧: {old['meta']['git_revision']}  新: {new['meta']['git_revision']}")
+    for r in new['results']:
+        base = old_results.get(r['size'])
+        if base is None:
+            continue
+        base_stages = {s['name']: s for s in base['stages']}
+        print(f"规模 {r['size']}:")
+        rows = [(s['name'], base_stages[s['name']], s) for s in r['stages'] if s['name'] in base_stages]
+        rows.append(('total', {'wall_seconds': base['total_seconds'], 'rss_peak_mb': base['rss_peak_mb']},
+                     {'wall_seconds': r['total_seconds'], 'rss_peak_mb': r['rss_peak_mb']}))
+        for name, a, b in rows:
+            ratio = b['wall_seconds'] / a['wall_seconds'] if a['wall_seconds'] else float('inf')
+            print(f"  {name:<36}{a['wall_seconds']:>10.3f} -> {b['wall_seconds']:<10.3f}x{ratio:<8.2f}"
+                  f"{a['rss_peak_mb']!s:>8} -> {b['rss_peak_mb']} MB")
+
+
+def main():
+    ap = argparse.ArgumentParser(description='弹幕分析基准测试')
+    ap.add_argument('--sizes', nargs='+', default=DEFAULT_SIZES, help='记录条数，支持 k/m 后缀')
+    ap.add_argument('--backend', default='snownlp', choices=['snownlp', 'batch'])
+    ap.add_argument('--workers', type=int, default=1)
+    ap.add_argument('--trace-memory', action='store_true', help='用 tracemalloc 记录每阶段的 Python 分配峰值（明显变慢）')
+    ap.add_argument('--font', default=None, help='词云字体，默认用 wordcloudg.FONT_PATH')
+    ap.add_argument('--seed', type=int, default=SEED)
+    ap.add_argument('--output', default=None, help='结果 JSON 路径，默认 bench_results/<提交>.json')
+    ap.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='对比两份结果 JSON')
+    args = ap.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    report = run_bench([parse_size(s) for s in args.sizes], args.backend, args.workers, args.trace_memory,
+                       args.font, args.seed)
+    output = args.output
+    if output is None:
+        rev = report['meta']['git_revision'] or 'unknown'
+        output = os.path.join(BENCH_RESULTS_FOLDER, f"{rev[:10]}{'-dirty' if report['meta']['git_dirty'] else ''}.json")
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"结果已写入: {output}")
+
+
+if __name__ == '__main__':
+    main()
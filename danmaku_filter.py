@@ -0,0 +1,80 @@
+import regex as re  # 使用 regex 模块以支持 \p{P} 等高级正则
+from collections import Counter
+
+# 空文本的拒绝原因（不属于任何正则）
+EMPTY_RULE = '<empty>'
+
+
+class DanmakuFilter:
+    """弹幕过滤引擎：所有规则合并为一个交替正则，一次 search 判定是否有效"""
+
+    def __init__(self, patterns):
+        self.patterns = list(patterns)
+        self.regex_list = [re.compile(p) for p in self.patterns]
+        # 每条规则包一层命名组，命中后可直接定位是哪条规则
+        self.combined = re.compile('|'.join(f'(?P<r{i}>{p})' for i, p in enumerate(self.patterns)))
+        self.reject_counts = Counter()
+        self.passed = 0
+
+    def rejected_by(self, text):
+        """返回拒绝该文本的规则（与逐条匹配时的第一条命中规则一致），有效则返回 None"""
+        if not text:
+            return EMPTY_RULE
+        m = self.combined.search(text)
+        if m is None:
+            return None
+        idx = int(m.lastgroup[1:])
+        # 合并正则返回的是最左侧命中的规则，排在它前面的规则可能在更靠后的位置命中
+        for i in range(idx):
+            if self.regex_list[i].search(text):
+                return self.patterns[i]
+        return self.patterns[idx]
+
+    def is_effective(self, text):
+        rule = self.rejected_by(text)
+        if rule is None:
+            self.passed += 1
+            return True
+        self.reject_counts[rule] += 1
+        return False
+
+    def filter_mask(self, texts):
+        """批量判定，返回与 texts 等长的布尔列表；重复文本只匹配一次"""
+        decided = {}
+        mask = []
+        reject_counts = self.reject_counts
+        for text in texts:
+            if text in decided:
+                rule = decided[text]
+            else:
+                rule = decided[text] = self.rejected_by(text)
+            if rule is None:
+                mask.append(True)
+            else:
+                reject_counts[rule] += 1
+                mask.append(False)
+        self.passed += mask.count(True)
+        return mask
+
+    def filter_texts(self, texts):
+        """批量过滤，返回有效文本列表"""
+        texts = list(texts)
+        return [t for t, ok in zip(texts, self.filter_mask(texts)) if ok]
+
+    def stats(self):
+        """返回 (规则, 拒绝次数) 列表，按拒绝次数降序"""
+        return self.reject_counts.most_common()
+
+    def report(self):
+        """过滤统计（供运行报告使用）：每条规则的拒绝次数，未命中的规则记为 0"""
+        total = self.passed + sum(self.reject_counts.values())
+        rules = {rule: self.reject_counts[rule] for rule in self.patterns}
+        if self.reject_counts[EMPTY_RULE]:
+            rules[EMPTY_RULE] = self.reject_counts[EMPTY_RULE]
+        return {'total': total, 'passed': self.passed, 'rejected': total - self.passed, 'reject_counts': rules}
+
+    def print_stats(self):
+        total = self.passed + sum(self.reject_counts.values())
+        print(f"过滤统计：共 {total} 条，保留 {self.passed} 条，拒绝 {total - self.passed} 条")
+        for rule, count in self.stats():
+            print(f"  {count:>8}  {rule}")
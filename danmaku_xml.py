@@ -0,0 +1,103 @@
+import xml.etree.ElementTree as ET
+
+# 弹幕 XML 解析（main.py / wordcloudg.py 共用）
+# <d> 为普通弹幕，<s> 为礼物/SC 记录，均为根节点 <i> 的直接子节点
+
+
+def parse_danmaku(attr, text):
+    """解析单条 <d> 记录，uid/timestamp 缺失时从 p 属性回退"""
+    p_attr = attr.get('p', '').split(',')
+    uid = attr.get('uid') or (p_attr[6] if len(p_attr) > 6 else '0')
+    ts = attr.get('timestamp') or (p_attr[4] if len(p_attr) > 4 else '0')
+    return {
+        'text': str(text).strip(),
+        'uid': uid,
+        'user': attr.get('user', '未知用户'),
+        'timestamp': float(ts),
+        'is_gift': False
+    }
+
+
+def parse_gift(attr, text):
+    """解析单条 <s> 记录"""
+    return {
+        'text': text if text else '',
+        'uid': attr.get('uid'),
+        'user': attr.get('username'),
+        'price': float(attr.get('price', 0)),
+        'num': int(attr.get('num', 1)),
+        'giftname': attr.get('giftname'),
+        'timestamp': float(attr.get('timestamp', 0)),
+        'is_gift': True
+    }
+
+
+def iter_records(xml_path):
+    """流式解析：单遍处理 <d>/<s>，逐条 yield (tag, record)，处理完即释放节点"""
+    depth = 0
+    root = None
+    for event, elem in ET.iterparse(xml_path, events=('start', 'end')):
+        if event == 'start':
+            if root is None:
+                root = elem
+            depth += 1
+            continue
+
+        depth -= 1
+        if depth != 1:
+            # 只处理根节点的直接子节点（与 root.findall 一致），更深层的等父节点结束时一并释放
+            continue
+
+        if elem.tag == 'd':
+            yield 'd', parse_danmaku(elem.attrib, elem.text)
+        elif elem.tag == 's':
+            yield 's', parse_gift(elem.attrib, elem.text)
+
+        # 已处理的子节点从根上摘掉，避免整棵树常驻内存
+        root.clear()
+
+
+def iter_records_tree(xml_path):
+    """整树解析（旧逻辑，保留用于对照）：先全部 <d> 再全部 <s>"""
+    root = ET.parse(xml_path).getroot()
+    for child in root.findall('d'):
+        yield 'd', parse_danmaku(child.attrib, child.text)
+    for child in root.findall('s'):
+        yield 's', parse_gift(child.attrib, child.text)
+
+
+class DanmakuPullParser:
+    """增量解析：数据可分多次 feed（如正在写入的录播文件），每次返回新解析出的 (tag, record) 列表"""
+
+    def __init__(self):
+        self._parser = ET.XMLPullParser(events=('start', 'end'))
+        self._depth = 0
+        self._root = None
+
+    def feed(self, data):
+        self._parser.feed(data)
+        return self._read()
+
+    def close(self):
+        """数据已全部送入：文档不完整时抛出 ET.ParseError，否则返回剩余的记录"""
+        self._parser.close()
+        return self._read()
+
+    def _read(self):
+        records = []
+        for event, elem in self._parser.read_events():
+            if event == 'start':
+                if self._root is None:
+                    self._root = elem
+                self._depth += 1
+                continue
+
+            self._depth -= 1
+            if self._depth != 1:
+                continue
+            if elem.tag == 'd':
+                records.append(('d', parse_danmaku(elem.attrib, elem.text)))
+            elif elem.tag == 's':
+                records.append(('s', parse_gift(elem.attrib, elem.text)))
+            self._root.clear()
+        return records
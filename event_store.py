@@ -0,0 +1,139 @@
+from array import array
+
+import numpy as np
+
+# 列式事件库：弹幕/礼物按列存为 numpy 数组，字符串字段字典编码为整数
+# 相比每条记录一个 dict，单条弹幕只占 ~30 字节（时间戳、uid/用户名/文本编码、有效标记、情感分数）
+
+SENTIMENT_TYPES = ('positive', 'neutral', 'negative')
+SENTIMENT_CODES = {name: code for code, name in enumerate(SENTIMENT_TYPES)}
+
+
+class Categorical:
+    """字符串字典编码：values[code] 为原值，相同的值只存一份"""
+
+    def __init__(self):
+        self.values = []
+        self._index = {}
+
+    def code(self, value):
+        c = self._index.get(value)
+        if c is None:
+            c = self._index[value] = len(self.values)
+            self.values.append(value)
+        return c
+
+    @classmethod
+    def from_values(cls, values):
+        cat = cls()
+        cat.values = list(values)
+        cat._index = {v: i for i, v in enumerate(cat.values)}
+        return cat
+
+    def lookup(self, value):
+        """返回已有值的编码，不存在时返回 -1"""
+        return self._index.get(value, -1)
+
+    def __len__(self):
+        return len(self.values)
+
+
+class EventStore:
+
+    def __init__(self):
+        # 文本在弹幕与礼物/SC 之间共用一张表，uid 同理
+        self.texts = Categorical()
+        self.uids = Categorical()
+        self.users = Categorical()
+        self.giftnames = Categorical()
+
+        self._danmaku_buf = {'timestamp': array('d'), 'uid': array('i'), 'user': array('i'), 'text': array('i')}
+        self._gift_buf = {'timestamp': array('d'), 'uid': array('i'), 'user': array('i'), 'text': array('i'),
+                          'price': array('d'), 'num': array('q'), 'giftname': array('i')}
+        self.danmaku = {}
+        self.gift = {}
+
+        # 处理结果：有效标记与情感分数/类别（非有效弹幕分数为 NaN，类别为 -1）
+        self.effective = None
+        self.sentiment_score = None
+        self.sentiment_type = None
+
+    # ================= 写入 =================
+
+    def add_danmaku(self, d):
+        buf = self._danmaku_buf
+        buf['timestamp'].append(d['timestamp'])
+        buf['uid'].append(self.uids.code(d['uid']))
+        buf['user'].append(self.users.code(d['user']))
+        buf['text'].append(self.texts.code(d['text']))
+
+    def add_gift(self, g):
+        buf = self._gift_buf
+        buf['timestamp'].append(g['timestamp'])
+        buf['uid'].append(self.uids.code(g['uid']))
+        buf['user'].append(self.users.code(g['user']))
+        buf['text'].append(self.texts.code(g['text']))
+        buf['price'].append(g['price'])
+        buf['num'].append(g['num'])
+        buf['giftname'].append(self.giftnames.code(g['giftname']))
+
+    def add(self, tag, record):
+        if tag == 'd':
+            self.add_danmaku(record)
+        else:
+            self.add_gift(record)
+
+    def finalize(self):
+        """写入结束后转为 numpy 列（直接复用 array 的内存，不额外拷贝）"""
+        dtypes = {'d': np.float64, 'i': np.int32, 'q': np.int64}
+        self.danmaku = {k: np.frombuffer(v, dtype=dtypes[v.typecode]) for k, v in self._danmaku_buf.items()}
+        self.gift = {k: np.frombuffer(v, dtype=dtypes[v.typecode]) for k, v in self._gift_buf.items()}
+        self.reset_results()
+
+    @classmethod
+    def from_columns(cls, danmaku, gift, texts, uids, users, giftnames):
+        """由现成的列与字典表构建（如从解析缓存加载）"""
+        store = cls()
+        store.danmaku = dict(danmaku)
+        store.gift = dict(gift)
+        store.texts = Categorical.from_values(texts)
+        store.uids = Categorical.from_values(uids)
+        store.users = Categorical.from_values(users)
+        store.giftnames = Categorical.from_values(giftnames)
+        store.reset_results()
+        return store
+
+    def reset_results(self):
+        n = self.n_danmaku
+        self.effective = np.zeros(n, dtype=bool)
+        self.sentiment_score = np.full(n, np.nan)
+        self.sentiment_type = np.full(n, -1, dtype=np.int8)
+
+    # ================= 读取 =================
+
+    @property
+    def n_danmaku(self):
+        return len(self.danmaku['timestamp']) if self.danmaku else len(self._danmaku_buf['timestamp'])
+
+    @property
+    def n_gift(self):
+        return len(self.gift['timestamp']) if self.gift else len(self._gift_buf['timestamp'])
+
+    def danmaku_texts(self, indices=None):
+        """按弹幕顺序返回文本列表（列表元素直接引用文本表中的字符串，不复制）"""
+        codes = self.danmaku['text'] if indices is None else self.danmaku['text'][indices]
+        values = self.texts.values
+        return [values[c] for c in codes.tolist()]
+
+    def effective_indices(self):
+        return np.flatnonzero(self.effective)
+
+    def gift_values(self):
+        """每条礼物记录的价值 price * num"""
+        return self.gift['price'] * self.gift['num']
+
+    def nbytes(self):
+        """列数据占用的字节数（不含字典表中的字符串）"""
+        cols = list(self.danmaku.values()) + list(self.gift.values())
+        cols += [c for c in (self.effective, self.sentiment_score, self.sentiment_type) if c is not None]
+        return sum(c.nbytes for c in cols)
@@ -0,0 +1,134 @@
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # Windows 没有 resource 模块，不统计峰值内存与子进程 CPU 时间
+    resource = None
+
+# 分阶段埋点：记录每个阶段的墙钟时间、CPU 时间、处理条数、吞吐量与峰值内存，
+# 连同过滤/缓存等附加指标写成 JSON 报告（放在 CSV 旁边），便于在真实直播上追踪耗时分布。
+# 指定 profile_stage 时，该阶段在 cProfile 下运行，.prof 文件写到报告旁，报告中附耗时最多的函数。
+
+
+def peak_rss_mb():
+    """进程至今的峰值常驻内存（Linux 上 ru_maxrss 单位为 KB，macOS 上为字节）；没有 resource 模块时返回 None"""
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def _children_cpu():
+    # 已结束的子进程（进程池工作进程）的 CPU 时间；没有 resource 模块时返回 None
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+class StageRecorder:
+    """用法：
+        recorder = StageRecorder()
+        with recorder.stage('filter', items=len(texts)) as rec:
+            ...
+            rec['items'] = n    # 条数在阶段结束时才知道的话可以在阶段内补上
+        recorder.add_metrics('filter', {...})
+        recorder.write('output/run_report.json')
+    阶段可以嵌套，嵌套阶段的名字为 '外层/内层'。"""
+
+    def __init__(self, profile_stage=None, profile_dir='.', trace_memory=False, profile_top=30):
+        self.profile_stage = profile_stage
+        self.profile_dir = profile_dir
+        self.profile_top = profile_top
+        self.trace_memory = trace_memory
+        self.stages = []
+        self.metrics = {}
+        self._stack = []
+        self._started = time.time()
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextlib.contextmanager
+    def stage(self, name, items=None):
+        self._stack.append(name)
+        full_name = '/'.join(self._stack)
+        rec = {'name': full_name, 'items': items}
+        profiler = None
+        if full_name == self.profile_stage:
+            import cProfile
+            profiler = cProfile.Profile()
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        rss_before = peak_rss_mb()
+        children_before = _children_cpu()
+        cpu_start = time.process_time()
+        wall_start = time.perf_counter()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield rec
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            wall = time.perf_counter() - wall_start
+            rec['wall_seconds'] = round(wall, 4)
+            rec['cpu_seconds'] = round(time.process_time() - cpu_start, 4)
+            children_after = _children_cpu()
+            rec['child_cpu_seconds'] = round(children_after - children_before, 4) if children_after is not None else None
+            rec['items_per_second'] = round(rec['items'] / wall, 1) if rec['items'] and wall > 0 else None
+            rec['rss_peak_mb'] = peak_rss_mb()
+            rec['rss_peak_growth_mb'] = round(rec['rss_peak_mb'] - rss_before, 1) if rss_before is not None else None
+            if self.trace_memory:
+                rec['py_peak_mb'] = round(tracemalloc.get_traced_memory()[1] / 1024 / 1024, 1)
+            if profiler is not None:
+                rec['profile'] = self._dump_profile(profiler, full_name)
+            self.stages.append(rec)
+            self._stack.pop()
+
+    def _dump_profile(self, profiler, name):
+        os.makedirs(self.profile_dir, exist_ok=True)
+        path = os.path.join(self.profile_dir, f"profile_{name.replace('/', '.')}.prof")
+        profiler.dump_stats(path)
+        import pstats
+        stats = pstats.Stats(profiler, stream=io.StringIO())
+        top = []
+        for (filename, line, func), (cc, nc, tt, ct, _) in sorted(stats.stats.items(), key=lambda kv: kv[1][3],
+                                                                  reverse=True)[:self.profile_top]:
+            top.append({'function': f"{filename}:{line}({func})", 'ncalls': nc, 'primitive_calls': cc,
+                        'tottime': round(tt, 4), 'cumtime': round(ct, 4)})
+        print(f"阶段 {name} 的 cProfile 结果已写入: {path}（可用 python -m pstats 或 snakeviz 查看）")
+        return {'path': path, 'top_cumulative': top}
+
+    def add_metrics(self, key, value):
+        self.metrics[key] = value
+
+    def report(self):
+        return {
+            'started_at': time.strftime('%Y-%m-%dT%H:%M:%S%z', time.localtime(self._started)),
+            'total_wall_seconds': round(time.time() - self._started, 4),
+            'rss_peak_mb': peak_rss_mb(),
+            'stages': self.stages,
+            'metrics': self.metrics,
+        }
+
+    def write(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.report(), f, ensure_ascii=False, indent=2)
+        print(f"运行报告已写入: {path}")
+
+    def summary(self):
+        """按阶段耗时的简要文本"""
+        lines = [f"{'阶段':<32}{'墙钟(s)':>10}{'CPU(s)':>10}{'条数':>10}{'条/秒':>12}{'峰值内存(MB)':>14}"]
+        for rec in self.stages:
+            items = '' if rec['items'] is None else rec['items']
+            rate = '' if rec['items_per_second'] is None else rec['items_per_second']
+            rss = '' if rec['rss_peak_mb'] is None else rec['rss_peak_mb']
+            lines.append(f"{rec['name']:<32}{rec['wall_seconds']:>10.3f}{rec['cpu_seconds']:>10.3f}"
+                         f"{items:>10}{rate:>12}{rss:>14}")
+        return '\n'.join(lines)
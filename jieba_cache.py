@@ -0,0 +1,91 @@
+import hashlib
+import marshal
+import os
+
+import jieba
+from jieba import finalseg
+
+# 分词词典缓存：jieba 自带的缓存只有主词典，自定义词典每次启动都要逐词 add_word（词频推算依赖当前词典状态）。
+# 这里把载入自定义词典之后的完整前缀词典整体 marshal 到自定义词典旁（wc/user_dict.txt -> wc/user_dict.txt.jieba），
+# 以 jieba 版本、主词典与自定义词典的内容为键，任一变化即重建。
+# 同一进程内只准备一次；进程池以 fork 启动前先在主进程准备好，工作进程直接继承已初始化的分词器。
+
+CACHE_SUFFIX = '.jieba'
+
+# 当前进程已准备好的自定义词典路径
+_prepared = None
+
+
+def cache_path_for(user_dict_path):
+    return user_dict_path + CACHE_SUFFIX
+
+
+def cache_key(user_dict_path):
+    h = hashlib.sha1()
+    with open(user_dict_path, 'rb') as f:
+        h.update(f.read())
+    dictionary = jieba.dt.dictionary or jieba.DEFAULT_DICT_NAME
+    st = os.stat(jieba.dt.dictionary) if jieba.dt.dictionary else None
+    return {
+        'jieba': jieba.__version__,
+        'dictionary': dictionary,
+        'dictionary_stat': [st.st_size, st.st_mtime_ns] if st else None,
+        'user_dict_sha1': h.hexdigest(),
+    }
+
+
+def _load(path, key):
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'rb') as f:
+            data = marshal.load(f)
+    except Exception as e:
+        print(f"读取分词词典缓存失败，忽略: {e}")
+        return None
+    return data if data.get('key') == key else None
+
+
+def _save(path, key, force_split):
+    dt = jieba.dt
+    data = {'key': key, 'freq': dt.FREQ, 'total': dt.total, 'tags': dt.user_word_tag_tab,
+            'force_split': sorted(force_split)}
+    tmp_path = path + '.tmp'
+    try:
+        with open(tmp_path, 'wb') as f:
+            marshal.dump(data, f)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"写入分词词典缓存失败，忽略: {e}")
+
+
+def prepare(user_dict_path, use_cache=True):
+    """初始化 jieba 默认分词器并载入自定义词典（词典不存在时只初始化主词典），返回是否载入了自定义词典"""
+    global _prepared
+    if user_dict_path and _prepared == user_dict_path:
+        return True
+    if not user_dict_path or not os.path.exists(user_dict_path):
+        jieba.initialize()
+        return False
+
+    dt = jieba.dt
+    key = cache_key(user_dict_path)
+    path = cache_path_for(user_dict_path)
+    data = _load(path, key) if use_cache and not dt.initialized else None
+    if data is not None:
+        with dt.lock:
+            dt.FREQ, dt.total = data['freq'], data['total']
+            dt.user_word_tag_tab.update(data['tags'])
+            for word in data['force_split']:
+                finalseg.add_force_split(word)
+            dt.initialized = True
+    else:
+        fresh = not dt.initialized
+        before = set(finalseg.Force_Split_Words)
+        jieba.initialize()
+        jieba.load_userdict(user_dict_path)
+        # 分词器在此之前已被单独初始化过（可能加过别的词）时，结果不一定只来自这两份词典，不写缓存
+        if use_cache and fresh:
+            _save(path, key, finalseg.Force_Split_Words - before)
+    _prepared = user_dict_path
+    return True
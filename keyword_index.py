@@ -0,0 +1,286 @@
+import os
+import time
+
+import numpy as np
+
+import archive_cache
+from event_store import SENTIMENT_TYPES
+from trend import bucket_index, detect_start_ts, format_labels, parse_time
+
+# 关键词倒排索引：对有效弹幕建立，查询某个词的时间序列（每桶命中数与平均情感）或命中的弹幕。
+# 以不同的有效文本为单位建索引（刷屏的相同文本只索引一次），再经 文本 -> 弹幕 的 CSR 表展开到每条弹幕：
+#   - 任意子串：相邻两个字符（字符二元组）-> 包含它的文本（有序的文本编号），查询时求各二元组倒排表的交集，
+#     长于 2 个字的词再逐条确认确实包含整个词；单字直接扫描文本表
+#   - 用户词典（wc/user_dict.txt）中的词条：建索引时预先算好每桶的命中数与情感分数之和，查询时只需合并分桶
+# 命中按子串计（“古士”也会命中“来古士”），区分大小写。索引写成一个文件（输出目录下的 keyword_index.bin），加载时内存映射。
+
+MAGIC = b'HSRKWI01'
+FILENAME = 'keyword_index.bin'
+# 最细的分桶间隔（秒），查询时可按它的整数倍合并
+BUCKET_STEP = 60
+# 第 0 桶的起点对齐到整点（ORIGIN_ALIGN 为分桶间隔的整数倍时），合并为 5 分钟、半小时等粗桶后边界仍落在整刻度上
+ORIGIN_ALIGN = 3600
+# 码位不超过 0x10FFFF（21 位），两个码位拼成一个 42 位的二元组键
+_CODEPOINT_BITS = 21
+
+
+def load_terms(dict_path):
+    """jieba 用户词典每行为 “词 [词频] [词性]”，按文件顺序返回去重后的词条"""
+    terms = {}
+    with open(dict_path, encoding='utf-8') as f:
+        for line in f:
+            parts = line.split()
+            if parts:
+                terms.setdefault(parts[0], None)
+    return list(terms)
+
+
+def _codepoints(texts):
+    """返回 (各文本长度, 拼接后的码位数组)"""
+    lengths = np.array([len(t) for t in texts], dtype=np.int64)
+    codepoints = np.frombuffer(''.join(texts).encode('utf-32-le'), dtype='<u4').astype(np.int64)
+    return lengths, codepoints
+
+
+def _bigram_keys(codepoints):
+    return (codepoints[:-1] << _CODEPOINT_BITS) | codepoints[1:]
+
+
+def _csr_positions(offsets, rows):
+    """CSR 表中若干行的下标拼接为一个数组"""
+    starts = offsets[rows]
+    lengths = offsets[rows + 1] - starts
+    return np.repeat(starts - (np.cumsum(lengths) - lengths), lengths) + np.arange(int(lengths.sum()))
+
+
+class KeywordIndex:
+    """用法：
+        index = KeywordIndex.build(store, load_terms('wc/user_dict.txt'))   # store 已完成过滤与情感打分
+        index.save('output/keyword_index.bin')
+        index = KeywordIndex.load('output/keyword_index.bin')
+        starts, counts, means = index.series('黄金裔', step=300)
+        rows = index.messages('翁法罗斯', limit=20)
+    """
+
+    def __init__(self, header, arrays):
+        self.step = header['step']
+        self.origin = header['origin']
+        self.n_buckets = header['n_buckets']
+        self.terms = header['terms']
+        self.term_index = {term: i for i, term in enumerate(self.terms)}
+        self.texts = archive_cache.decode_strings(arrays['texts.nulls'], arrays['texts.blob'])
+        self.users = archive_cache.decode_strings(arrays['users.nulls'], arrays['users.blob'])
+        # 有效弹幕（按原顺序）的各列
+        self.msg_ts = arrays['msg.timestamp']
+        self.msg_score = arrays['msg.score']
+        self.msg_type = arrays['msg.type']
+        self.msg_user = arrays['msg.user']
+        self.msg_text = arrays['msg.text']
+        # 文本编号 -> 弹幕下标（CSR）
+        self.text_offsets = arrays['text.offsets']
+        self.text_msgs = arrays['text.msgs']
+        # 字符二元组 -> 文本编号（CSR，键有序）
+        self.gram_keys = arrays['gram.keys']
+        self.gram_offsets = arrays['gram.offsets']
+        self.gram_texts = arrays['gram.texts']
+        # 词典词条的每桶命中数与情感分数之和（词条数 × 桶数）
+        self.term_counts = arrays['term.counts'].reshape(len(self.terms), self.n_buckets)
+        self.term_score_sums = arrays['term.score_sums'].reshape(len(self.terms), self.n_buckets)
+
+    # ================= 建立与存取 =================
+
+    @classmethod
+    def build(cls, store, terms=(), step=BUCKET_STEP):
+        eff = store.effective_indices()
+        uniq, msg_text = np.unique(store.danmaku['text'][eff], return_inverse=True)
+        texts = [store.texts.values[c] for c in uniq.tolist()]
+        user_codes, msg_user = np.unique(store.danmaku['user'][eff], return_inverse=True)
+        ts = store.danmaku['timestamp'][eff]
+        origin = detect_start_ts(ts, ORIGIN_ALIGN if ORIGIN_ALIGN % step == 0 else step) or 0
+        n_buckets = int(bucket_index(ts, origin, step).max()) + 1 if len(ts) else 0
+
+        text_offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(msg_text, minlength=len(texts)), out=text_offsets[1:])
+
+        # 每个文本中出现的二元组（去重）按 (键, 文本编号) 排序
+        lengths, codepoints = _codepoints(texts)
+        owner = np.repeat(np.arange(len(texts), dtype=np.int64), lengths)
+        same = owner[:-1] == owner[1:]
+        keys = _bigram_keys(codepoints)[same]
+        owner = owner[:-1][same]
+        order = np.lexsort((owner, keys))
+        keys, owner = keys[order], owner[order]
+        keep = np.ones(len(keys), dtype=bool)
+        keep[1:] = (keys[1:] != keys[:-1]) | (owner[1:] != owner[:-1])
+        keys, owner = keys[keep], owner[keep]
+        gram_keys, gram_starts = np.unique(keys, return_index=True)
+
+        arrays = {}
+        for name, values in (('texts', texts), ('users', [store.users.values[c] for c in user_codes.tolist()])):
+            arrays[f'{name}.nulls'], arrays[f'{name}.blob'] = archive_cache.encode_strings(values)
+        arrays.update({
+            'msg.timestamp': ts,
+            'msg.score': store.sentiment_score[eff],
+            'msg.type': store.sentiment_type[eff],
+            'msg.user': msg_user.astype(np.int32),
+            'msg.text': msg_text.astype(np.int32),
+            'text.offsets': text_offsets,
+            'text.msgs': np.argsort(msg_text, kind='stable').astype(np.int32),
+            'gram.keys': gram_keys,
+            'gram.offsets': np.append(gram_starts, len(keys)).astype(np.int64),
+            'gram.texts': owner.astype(np.int32),
+            'term.counts': np.zeros(0, dtype=np.int64),
+            'term.score_sums': np.zeros(0, dtype=np.float64),
+        })
+        header = {'step': step, 'origin': origin, 'n_buckets': n_buckets, 'terms': []}
+
+        # 词典词条的分桶结果用同一套子串查询算出
+        index = cls(header, arrays)
+        binned = [index._binned(index.match(term)) for term in terms]
+        if binned:
+            arrays['term.counts'] = np.concatenate([counts for counts, _ in binned])
+            arrays['term.score_sums'] = np.concatenate([sums for _, sums in binned])
+        return cls(dict(header, terms=list(terms)), arrays)
+
+    def save(self, path):
+        arrays = {}
+        for name, values in (('texts', self.texts), ('users', self.users)):
+            arrays[f'{name}.nulls'], arrays[f'{name}.blob'] = archive_cache.encode_strings(values)
+        arrays.update({
+            'msg.timestamp': self.msg_ts, 'msg.score': self.msg_score, 'msg.type': self.msg_type,
+            'msg.user': self.msg_user, 'msg.text': self.msg_text,
+            'text.offsets': self.text_offsets, 'text.msgs': self.text_msgs,
+            'gram.keys': self.gram_keys, 'gram.offsets': self.gram_offsets, 'gram.texts': self.gram_texts,
+            'term.counts': self.term_counts.ravel(), 'term.score_sums': self.term_score_sums.ravel(),
+        })
+        header = {'step': self.step, 'origin': self.origin, 'n_buckets': self.n_buckets, 'terms': self.terms}
+        archive_cache.write_arrays(path, header, arrays, MAGIC)
+        print(f"关键词索引已保存: {path}（{len(self.texts)} 种文本，{len(self.gram_keys)} 个二元组，"
+              f"{len(self.terms)} 个词典词条，{os.path.getsize(path) / 1024 / 1024:.1f} MB）")
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            header = archive_cache.read_header(f, MAGIC)
+            if header is None:
+                raise ValueError(f"{path} 不是关键词索引文件")
+            arrays = archive_cache.map_arrays(f, header, MAGIC)
+        return cls(header, arrays)
+
+    # ================= 查询 =================
+
+    def match(self, term):
+        """包含 term 的文本编号（升序）"""
+        if not term:
+            return np.zeros(0, dtype=np.int64)
+        if len(term) == 1:
+            return np.array([i for i, t in enumerate(self.texts) if term in t], dtype=np.int64)
+        keys = np.unique(_bigram_keys(_codepoints([term])[1]))
+        pos = np.searchsorted(self.gram_keys, keys)
+        if (pos >= len(self.gram_keys)).any() or (self.gram_keys[np.minimum(pos, len(self.gram_keys) - 1)] != keys).any():
+            return np.zeros(0, dtype=np.int64)
+        # 从最短的倒排表开始求交集
+        postings = sorted((self.gram_texts[self.gram_offsets[p]:self.gram_offsets[p + 1]] for p in pos.tolist()), key=len)
+        ids = postings[0]
+        for other in postings[1:]:
+            ids = np.intersect1d(ids, other, assume_unique=True)
+            if not len(ids):
+                break
+        if len(term) > 2:
+            # 各二元组都出现不代表它们相连，逐条确认
+            ids = [i for i in ids.tolist() if term in self.texts[i]]
+        return np.asarray(ids, dtype=np.int64)
+
+    def positions(self, term, start=None, end=None):
+        """命中弹幕在有效弹幕中的下标（按原顺序），可按时间戳范围 [start, end) 截取"""
+        positions = self.text_msgs[_csr_positions(self.text_offsets, self.match(term))]
+        positions.sort()
+        if start is not None or end is not None:
+            ts = self.msg_ts[positions]
+            keep = np.ones(len(positions), dtype=bool)
+            if start is not None:
+                keep &= ts >= start
+            if end is not None:
+                keep &= ts < end
+            positions = positions[keep]
+        return positions
+
+    def _binned(self, text_ids):
+        return self._bin_messages(self.text_msgs[_csr_positions(self.text_offsets, text_ids)])
+
+    def _bin_messages(self, msgs):
+        idx = bucket_index(self.msg_ts[msgs], self.origin, self.step)
+        counts = np.bincount(idx, minlength=self.n_buckets)
+        sums = np.bincount(idx, weights=self.msg_score[msgs], minlength=self.n_buckets)
+        return counts.astype(np.int64), sums
+
+    def series(self, term, step=None, start=None, end=None):
+        """返回 (各桶起始时间戳, 命中数, 平均情感分数)，无命中的桶平均分为 NaN；step 须为 BUCKET_STEP 的整数倍。
+        给出 start / end 时只统计时间戳在 [start, end) 内的弹幕（桶仍按整桶排列，边界桶只计范围内的部分）"""
+        step = self.step if step is None else step
+        if step % self.step:
+            raise ValueError(f"分桶间隔须为 {self.step} 秒的整数倍")
+        i = self.term_index.get(term)
+        if start is not None or end is not None:
+            counts, sums = self._bin_messages(self.positions(term, start, end))
+        elif i is None:
+            counts, sums = self._binned(self.match(term))
+        else:
+            counts, sums = self.term_counts[i], self.term_score_sums[i]
+        k = step // self.step
+        n = -(-self.n_buckets // k)
+        counts = np.pad(counts, (0, n * k - self.n_buckets)).reshape(n, k).sum(axis=1)
+        sums = np.pad(sums, (0, n * k - self.n_buckets)).reshape(n, k).sum(axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = np.where(counts > 0, sums / counts, np.nan)
+        return self.origin + np.arange(n, dtype=np.float64) * step, counts, means
+
+    def messages(self, term, limit=None, start=None, end=None):
+        """命中的弹幕（按原顺序），可按时间范围 [start, end) 截取；返回 dict 列表"""
+        positions = self.positions(term, start, end)[:limit]
+        texts = [self.texts[i] for i in self.msg_text[positions].tolist()]
+        return [{'timestamp': t, 'user': self.users[u], 'text': text, 'score': s, 'type': SENTIMENT_TYPES[c]}
+                for t, u, text, s, c in zip(self.msg_ts[positions].tolist(), self.msg_user[positions].tolist(), texts,
+                                            self.msg_score[positions].tolist(), self.msg_type[positions].tolist())]
+
+
+if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser(description='查询关键词索引：词条的时间序列与命中弹幕')
+    ap.add_argument('index', nargs='?', default=os.path.join('output', FILENAME))
+    ap.add_argument('terms', nargs='*', help='要查询的词（任意子串）；不给时列出词典词条的命中数')
+    ap.add_argument('--step', type=int, help=f'分桶间隔（秒），须为索引分桶间隔（默认 {BUCKET_STEP}）的整数倍')
+    ap.add_argument('--from', dest='start', help='起始时间 HH:MM[:SS] 或时间戳')
+    ap.add_argument('--to', dest='end', help='结束时间 HH:MM[:SS] 或时间戳')
+    ap.add_argument('--messages', type=int, metavar='N', help='列出前 N 条命中的弹幕')
+    args = ap.parse_args()
+
+    index = KeywordIndex.load(args.index)
+    start = parse_time(args.start, index.origin) if args.start else None
+    end = parse_time(args.end, index.origin) if args.end else None
+    if not args.terms:
+        totals = index.term_counts.sum(axis=1)
+        for i in np.argsort(-totals, kind='stable').tolist():
+            print(f"{int(totals[i]):>8}  {index.terms[i]}")
+
+    for term in args.terms:
+        t0 = time.perf_counter()
+        starts, counts, means = index.series(term, args.step, start, end)
+        keep = counts > 0
+        rows = [] if args.messages is None else index.messages(term, args.messages, start, end)
+        elapsed = (time.perf_counter() - t0) * 1000
+        total = int(counts[keep].sum())
+        if not total:
+            print(f"=== {term}：无命中 ===")
+            continue
+        mean = float(np.nansum(means[keep] * counts[keep]) / total)
+        labels = format_labels(starts[keep])
+        first = format_labels([index.messages(term, 1, start, end)[0]['timestamp']])[0]
+        print(f"=== {term}：命中 {total} 条，首次出现 {first}，平均情感 {mean:.4f}（查询耗时 {elapsed:.1f} ms）===")
+        print("时间轴      命中数  平均情感")
+        for label, n, score in zip(labels, counts[keep].tolist(), means[keep].tolist()):
+            print(f"{label}  {n:>8}  {score:.4f}")
+        if rows:
+            print(f"--- 命中弹幕（前 {len(rows)} 条）---")
+            for label, row in zip(format_labels([r['timestamp'] for r in rows]), rows):
+                print(f"[{label}] [{row['score']:.4f} {row['type']}] {row['user']}: {row['text']}")
@@ -0,0 +1,364 @@
+import argparse
+import asyncio
+import csv
+import heapq
+import json
+import os
+import time
+from collections import defaultdict, Counter
+from datetime import datetime
+
+from danmaku_filter import DanmakuFilter
+from danmaku_xml import DanmakuPullParser, iter_records
+from main import (ANONYMIZE_UIDS, INVALID_REGEX_PATTERNS, MODEL_PATH, SENTIMENT_CACHE_SIZE, TREND_START_TS, TREND_STEP,
+                  classify_score)
+from pm9 import PM9Cache, anonymize_rows
+from sentiment_cache import SentimentCache
+
+# 直播实时模式：从可替换的数据源持续读取弹幕/礼物事件，增量更新统计并定时输出 CSV 快照
+#   python live.py tail input.xml            追踪正在写入的录播 XML（--jsonl 为 JSONL）
+#   python live.py serve input.xml --rate 5000   以指定速率通过本地 socket 回放录播（模拟直播）
+#   python live.py connect                   连接上面的回放 socket
+#   python live.py replay input.xml --rate 5000  同一进程内回放并统计
+
+# ================= 配置区域 =================
+LIVE_OUTPUT_FOLDER = 'live_output'
+FLUSH_INTERVAL = 10         # CSV 快照间隔（秒）
+POLL_INTERVAL = 0.2         # 追踪文件时无新数据的等待间隔（秒）
+REPLAY_HOST = '127.0.0.1'
+REPLAY_PORT = 9000
+READ_SIZE = 1 << 16
+# ==========================================
+
+# UID 匿名化的摘要缓存，快照反复输出时同一 UID 只计算一次
+_uid_anonymizer = PM9Cache(keep_invalid=True)
+
+
+class LiveStats:
+    """增量统计：每条事件只更新累加器，快照时直接由累加器生成报表，不回扫原始数据"""
+
+    def __init__(self, start_ts=TREND_START_TS, step=TREND_STEP, sentiment_cache=None):
+        self.start_ts = start_ts
+        self.step = step
+        self.filter = DanmakuFilter(INVALID_REGEX_PATTERNS)
+        self.sentiment_cache = sentiment_cache
+        self.event_count = 0
+
+        # 总体
+        self.total_d = 0
+        self.gift_value_no_sc = 0.0
+        self.gift_senders = set()
+        self.sc_value = 0.0
+        self.sc_list = []
+
+        # 用户
+        self.user_names = {}
+        self.user_counts = Counter()
+        # 每个用户的弹幕计数（文本驻留为同一对象，内存与不同的 (用户, 文本) 对数成正比）
+        self.user_msgs = defaultdict(Counter)
+        self._texts = {}
+        self.gift_users = defaultdict(lambda: {'name': '', 'total_value': 0, 'gifts': Counter()})
+
+        # 情感
+        self.effective_count = 0
+        self.sentiment_counts = Counter()
+        self.score_sum = 0.0
+        self.neg_users = Counter()
+        self.neu_users = Counter()
+
+        # 趋势：桶序号 -> [弹幕数, 积极, 中性, 消极, 礼物价值]
+        self.buckets = defaultdict(lambda: [0, 0, 0, 0, 0.0])
+        self.max_ts = None
+
+    def _bucket(self, ts):
+        if self.max_ts is None or ts > self.max_ts:
+            self.max_ts = ts
+        if self.start_ts is None:
+            # 未指定起始时间时取第一条事件所在的整桶
+            self.start_ts = int(ts // self.step * self.step)
+        if ts < self.start_ts:
+            return None
+        return self.buckets[int((ts - self.start_ts) / self.step)]
+
+    def add_batch(self, records):
+        """按到达顺序处理一批 (tag, record)"""
+        texts = [r['text'] for tag, r in records if tag == 'd']
+        mask = iter(self.filter.filter_mask(texts))
+        for tag, r in records:
+            if tag == 'd':
+                self._add_danmaku(r, next(mask))
+            else:
+                self._add_gift(r)
+        self.event_count += len(records)
+
+    def _add_danmaku(self, d, effective):
+        uid = d['uid']
+        self.total_d += 1
+        self.user_names[uid] = d['user']
+        self.user_counts[uid] += 1
+        text = self._texts.setdefault(d['text'], d['text'])
+        self.user_msgs[uid][text] += 1
+        bucket = self._bucket(d['timestamp'])
+        if bucket is not None:
+            bucket[0] += 1
+        if not effective:
+            return
+
+        self.effective_count += 1
+        if self.sentiment_cache is None:
+            return
+        score = self.sentiment_cache.score(d['text'])
+        stype = classify_score(score)
+        self.sentiment_counts[stype] += 1
+        self.score_sum += score
+        if stype == 'negative':
+            self.neg_users[uid] += 1
+        elif stype == 'neutral':
+            self.neu_users[uid] += 1
+        if bucket is not None:
+            bucket[{'positive': 1, 'neutral': 2, 'negative': 3}[stype]] += 1
+
+    def _add_gift(self, g):
+        val = g['price'] * g['num']
+        if g['giftname'] == '醒目留言':
+            self.sc_value += val
+            self.sc_list.append(g)
+        else:
+            self.gift_value_no_sc += val
+            self.gift_senders.add(g['uid'])
+        user = self.gift_users[g['uid']]
+        user['name'] = g['user']
+        user['total_value'] += val
+        user['gifts'][f"{g['giftname']}x{g['num']}"] += 1
+        bucket = self._bucket(g['timestamp'])
+        if bucket is not None:
+            bucket[4] += val
+
+    # ================= 快照输出 =================
+
+    @staticmethod
+    def _format_freq(counter):
+        return " | ".join(f"{k}({v}次)" for k, v in counter.most_common())
+
+    @staticmethod
+    def _write_csv(folder, filename, headers, rows):
+        if ANONYMIZE_UIDS:
+            rows = anonymize_rows(headers, rows, _uid_anonymizer)
+        path = os.path.join(folder, filename)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', newline='', encoding='utf-8-sig') as f:
+            writer = csv.writer(f)
+            writer.writerow(headers)
+            writer.writerows(rows)
+        # 先写临时文件再替换，避免外部读到写了一半的快照
+        os.replace(tmp_path, path)
+
+    def _trend_rows(self):
+        if self.start_ts is None:
+            return []
+        rows = [[datetime.fromtimestamp(self.start_ts).strftime('%H:%M:%S'), 0, 0, 0, 0, 0, 0.0, 0.0]]
+        end_ts = self.max_ts if self.max_ts is not None else self.start_ts
+        acc_d_count = 0
+        acc_g_val = 0.0
+        empty = [0, 0, 0, 0, 0.0]
+        for i in range(int((end_ts - self.start_ts) / self.step) + 2):
+            d_count, pos, neu, neg, g_val = self.buckets.get(i, empty)
+            acc_d_count += d_count
+            acc_g_val += g_val
+            dt_str = datetime.fromtimestamp(self.start_ts + (i + 1) * self.step).strftime('%H:%M:%S')
+            rows.append([dt_str, d_count, pos, neu, neg, acc_d_count, round(g_val / 100, 2), round(acc_g_val / 100, 2)])
+        return rows
+
+    def write_snapshot(self, folder):
+        os.makedirs(folder, exist_ok=True)
+        self._write_csv(folder, '1_总体统计.csv',
+                        ['总弹幕数', '弹幕发送人数', '礼物总价值(无SC)', '送礼人数', 'SC总价值', 'SC总数量'],
+                        [[self.total_d, len(self.user_counts), round(self.gift_value_no_sc, 2), len(self.gift_senders),
+                          round(self.sc_value, 2), len(self.sc_list)]])
+
+        top_users = heapq.nlargest(20, self.user_counts.items(), key=lambda x: x[1])
+        self._write_csv(folder, '2_弹幕发送Top20.csv', ['UID', '用户名', '发送数量', '弹幕频率列表'],
+                        [[uid, self.user_names[uid], count, self._format_freq(self.user_msgs[uid])] for uid, count in top_users])
+
+        top_gifts = heapq.nlargest(20, self.gift_users.items(), key=lambda x: x[1]['total_value'])
+        self._write_csv(folder, '3_礼物贡献Top20.csv', ['UID', '用户名', '礼物总价值', '礼物列表'],
+                        [[uid, data['name'], round(data['total_value'], 2), self._format_freq(data['gifts'])] for uid, data in top_gifts])
+
+        sc_list = sorted(self.sc_list, key=lambda x: x['price'], reverse=True)
+        self._write_csv(folder, '4_所有SC记录.csv', ['UID', '用户名', '价值', '留言内容'],
+                        [[sc['uid'], sc['user'], sc['price'], sc['text']] for sc in sc_list])
+
+        self._write_csv(folder, '5_有效弹幕统计.csv', ['有效弹幕数量'], [[self.effective_count]])
+
+        if self.sentiment_cache is not None and self.effective_count:
+            c = self.sentiment_counts
+            self._write_csv(folder, '6_情感分析总览.csv', ['积极数量', '消极数量', '中性数量', '平均情感置信度'],
+                            [[c['positive'], c['negative'], c['neutral'], round(self.score_sum / self.effective_count, 4)]])
+            rows = []
+            for uid, count in heapq.nlargest(5, self.neg_users.items(), key=lambda x: x[1]):
+                rows.append(['消极Top5', uid, self.user_names[uid], count, self._format_freq(self.user_msgs[uid])])
+            for uid, count in heapq.nlargest(3, self.neu_users.items(), key=lambda x: x[1]):
+                rows.append(['中性Top3', uid, self.user_names[uid], count, self._format_freq(self.user_msgs[uid])])
+            self._write_csv(folder, '7_特定情感倾向用户Top.csv', ['榜单类型', 'UID', '用户名', '特定情感弹幕数', '所有弹幕列表'], rows)
+
+        headers = ['时间轴', f'当前{self.step}s总弹幕数', '积极弹幕数', '中性弹幕数', '消极弹幕数', '累计弹幕数',
+                   f'当前{self.step}s礼物(元)', '累计礼物(元)']
+        self._write_csv(folder, '8_趋势统计_详细情感.csv', headers, self._trend_rows())
+
+
+# ================= 数据源 =================
+# 每个数据源都是异步生成器，按批 yield [(tag, record), ...]
+
+def _parse_jsonl(lines):
+    records = []
+    for line in lines:
+        if not line.strip():
+            continue
+        obj = json.loads(line)
+        records.append((obj.pop('tag'), obj))
+    return records
+
+
+async def tail_file(path, fmt='xml', follow=True, poll_interval=POLL_INTERVAL):
+    """追踪正在写入的文件：XML 用增量解析器，JSONL 按行解析；follow=False 时读到末尾即结束"""
+    parser = DanmakuPullParser() if fmt == 'xml' else None
+    pending = b''
+    with open(path, 'rb') as f:
+        while True:
+            data = f.read(READ_SIZE)
+            if not data:
+                if not follow:
+                    # 文件末尾没有换行时，最后一行还留在 pending 中
+                    if pending.strip():
+                        yield _parse_jsonl([pending])
+                    break
+                await asyncio.sleep(poll_interval)
+                continue
+            if parser is not None:
+                records = parser.feed(data)
+            else:
+                lines = (pending + data).split(b'\n')
+                pending = lines.pop()
+                records = _parse_jsonl(lines)
+            if records:
+                yield records
+
+
+async def socket_source(host=REPLAY_HOST, port=REPLAY_PORT):
+    """从本地回放 socket 读取 JSONL 事件，对端关闭连接时结束"""
+    reader, writer = await asyncio.open_connection(host, port)
+    pending = b''
+    try:
+        while True:
+            data = await reader.read(READ_SIZE)
+            if not data:
+                if pending.strip():
+                    yield _parse_jsonl([pending])
+                break
+            lines = (pending + data).split(b'\n')
+            pending = lines.pop()
+            records = _parse_jsonl(lines)
+            if records:
+                yield records
+    finally:
+        writer.close()
+
+
+async def start_replay_server(xml_path, rate, host=REPLAY_HOST, port=REPLAY_PORT, tick=0.05):
+    """本地 socket 回放：每个连接按 rate 条/秒重放录播文件中的事件（JSONL）"""
+
+    async def handle(reader, writer):
+        started = time.monotonic()
+        sent = 0
+        batch = []
+        try:
+            for tag, record in iter_records(xml_path):
+                batch.append(json.dumps({'tag': tag, **record}, ensure_ascii=False))
+                if len(batch) < max(1, int(rate * tick)):
+                    continue
+                writer.write(('\n'.join(batch) + '\n').encode('utf-8'))
+                await writer.drain()
+                sent += len(batch)
+                batch = []
+                # 按目标速率控制发送节奏
+                delay = sent / rate - (time.monotonic() - started)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            if batch:
+                writer.write(('\n'.join(batch) + '\n').encode('utf-8'))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
+
+
+# ================= 主循环 =================
+
+async def run_live(source, stats, output_folder=LIVE_OUTPUT_FOLDER, flush_interval=FLUSH_INTERVAL):
+    """消费数据源并按间隔写出快照，数据源结束时写最后一次快照"""
+    started = time.monotonic()
+    last_flush = started
+
+    def flush():
+        stats.write_snapshot(output_folder)
+        elapsed = time.monotonic() - started
+        rate = stats.event_count / elapsed if elapsed > 0 else 0.0
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] 快照已更新：累计事件 {stats.event_count} 条，"
+              f"弹幕 {stats.total_d} 条，平均 {rate:.0f} 条/秒")
+
+    async for records in source:
+        stats.add_batch(records)
+        now = time.monotonic()
+        if now - last_flush >= flush_interval:
+            flush()
+            last_flush = now
+    flush()
+    if stats.sentiment_cache is not None:
+        print(stats.sentiment_cache.summary())
+
+
+async def _replay(args, stats):
+    server = await start_replay_server(args.path, args.rate, args.host, args.port)
+    async with server:
+        await run_live(socket_source(args.host, args.port), stats, args.output, args.flush_interval)
+
+
+def main():
+    ap = argparse.ArgumentParser(description='直播实时统计')
+    ap.add_argument('mode', choices=['tail', 'serve', 'connect', 'replay'])
+    ap.add_argument('path', nargs='?', default='input.xml', help='录播文件（tail/serve/replay）')
+    ap.add_argument('--jsonl', action='store_true', help='tail 模式下文件为 JSONL')
+    ap.add_argument('--once', action='store_true', help='tail 模式下读到文件末尾即结束')
+    ap.add_argument('--rate', type=float, default=5000, help='回放速率（条/秒）')
+    ap.add_argument('--host', default=REPLAY_HOST)
+    ap.add_argument('--port', type=int, default=REPLAY_PORT)
+    ap.add_argument('--output', default=LIVE_OUTPUT_FOLDER)
+    ap.add_argument('--flush-interval', type=float, default=FLUSH_INTERVAL)
+    ap.add_argument('--no-sentiment', action='store_true', help='不做情感分析（只统计数量/礼物/趋势）')
+    args = ap.parse_args()
+
+    if args.mode == 'serve':
+        async def serve():
+            server = await start_replay_server(args.path, args.rate, args.host, args.port)
+            print(f"回放服务已启动: {args.host}:{args.port}，速率 {args.rate:.0f} 条/秒")
+            async with server:
+                await server.serve_forever()
+        asyncio.run(serve())
+        return
+
+    cache = None if args.no_sentiment else SentimentCache(MODEL_PATH, SENTIMENT_CACHE_SIZE)
+    stats = LiveStats(sentiment_cache=cache)
+    if args.mode == 'tail':
+        source = tail_file(args.path, 'jsonl' if args.jsonl else 'xml', follow=not args.once)
+        asyncio.run(run_live(source, stats, args.output, args.flush_interval))
+    elif args.mode == 'connect':
+        asyncio.run(run_live(socket_source(args.host, args.port), stats, args.output, args.flush_interval))
+    else:
+        asyncio.run(_replay(args, stats))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,24 @@
-import xml.etree.ElementTree as ET
-import csv
-import regex as re
 import os
 import time
-from collections import defaultdict, Counter
+from collections import Counter
 from datetime import datetime
-
-from snownlp import SnowNLP
-from snownlp import sentiment
+from functools import partial
+
+import numpy as np
+
+import archive_cache
+import keyword_index
+import scored_run
+from aggregate import ReportAggregates, top_k
+from danmaku_filter import DanmakuFilter
+from danmaku_xml import iter_records, iter_records_tree
+from event_store import EventStore, SENTIMENT_CODES, SENTIMENT_TYPES
+from instrument import StageRecorder
+from near_dup import NearDuplicateCollapser, collapse_codes
+from parallel_xml import parse_parallel
+import output_writer
+from pm9 import PM9Cache, anonymize_store
+from sentiment_cache import SentimentCache, model_digest
 
 # =================配置区域=================
 INVALID_REGEX_PATTERNS = [
@@ -26,327 +37,505 @@ INVALID_REGEX_PATTERNS = [
 
 # 模型路径
 MODEL_PATH = './snow/hsr3.8.marshal' 
-sentiment.load(MODEL_PATH)
+# 模型在第一次情感打分时才加载（sentiment_cache.sentiment_model），只生成非情感报表时不导入 snownlp
+
+# 情感分数缓存：内存 LRU 上限（条），以及是否落盘（缓存文件与模型文件绑定，换模型自动失效）
+SENTIMENT_CACHE_SIZE = 200000
+SENTIMENT_DISK_CACHE = True
+
+# 多进程情感推理（可选）：进程数为 1 时串行；CHUNKSIZE 为每次分发给工作进程的条数
+SENTIMENT_WORKERS = 1
+SENTIMENT_CHUNKSIZE = 500
+
+# 情感推理后端：'snownlp' 逐条调用 SnowNLP；'batch' 使用 nb_scorer 的向量化批量打分（需要 numpy，分数在浮点误差内一致）
+SENTIMENT_BACKEND = 'snownlp'
+
+# 近重复折叠（可选）：只差标点、叠字、表情后缀的变体与相似的复制粘贴刷屏归为一簇，每簇只对代表文本打分，分数回填给簇内所有弹幕。
+# 会让这些变体得到与代表相同的分数（与逐条打分略有出入），默认关闭
+NEAR_DUP_COLLAPSE = False
+# 归一化（去标点/表情/空白、叠字压缩）后相同的直接合并；不同的按字符二元组集合的 Jaccard 相似度合并，须同时满足：
+#   Jaccard 不低于 NEAR_DUP_JACCARD（19 字的句子改 1 个字约为 0.8），长度比（短 / 长）不低于 NEAR_DUP_LENGTH_RATIO，
+#   且数字串完全相同（'翁法罗斯179' 与 '翁法罗斯117' 不合并）；归一化后短于 6 个字的文本只做精确合并
+NEAR_DUP_JACCARD = 0.7
+NEAR_DUP_LENGTH_RATIO = 0.8
+
+# 情感分类阈值：高于 POSITIVE_THRESHOLD 为积极，低于 NEGATIVE_THRESHOLD 为消极，其余为中性
+POSITIVE_THRESHOLD = 0.65
+NEGATIVE_THRESHOLD = 0.35
+
+# 趋势统计：起始时间戳（请根据你的视频实际开始时间修改这里！设为 None 则自动取最早事件所在的整桶）与分桶间隔（秒）
+TREND_START_TS = 1764932400
+TREND_STEP = 30
+# 额外输出的粗粒度趋势表（秒），如 (60, 300)，与 TREND_STEP 在同一次分桶中算出
+TREND_EXTRA_STEPS = ()
+
+# 多进程解析：XML 在 <d>/<s> 边界切块后由 PARSE_WORKERS 个进程并行解析（结果与串行解析逐条一致）；1 为串行，小文件总是串行
+PARSE_WORKERS = 1
+
+# 解析缓存：在 XML 旁写入二进制列式缓存（input.xml.cache），再次运行时直接内存映射加载，跳过 XML 解析
+ARCHIVE_CACHE = True
+
+# UID 匿名化：为 True 时加载后即把事件库的 UID 表替换为 pm9 摘要（PM + 9 位数字，同一 UID 始终得到相同摘要），
+# 所有 CSV、列式输出与 scored_run.bin 中都只有摘要；XML 旁的解析缓存（input.xml.cache）与原始 XML 一样保留原始 UID
+ANONYMIZE_UIDS = False
+
+# 输出压缩：None 为普通 UTF-8-BOM CSV（默认）；'gzip' 或 'zstd' 时 CSV 与核查文件压缩写出（文件名加 .gz / .zst，zstd 需要 Python 3.14+ 或 zstandard）
+OUTPUT_COMPRESSION = None
+# 列式输出：'npz' 或 'parquet'（需要 pyarrow）时，额外把有效弹幕表（含情感分数与类别）写成 有效弹幕.npz / 有效弹幕.parquet，None 为不输出
+COLUMNAR_OUTPUT = None
+
+# 关键词倒排索引：对有效弹幕按用户词典词条与任意子串（字符二元组）建立倒排索引，连同每 KEYWORD_INDEX_STEP 秒的命中数与平均情感
+# 写到输出目录的 keyword_index.bin；查询：python keyword_index.py output/keyword_index.bin 黄金裔 翁法罗斯 --step 300 --messages 20
+KEYWORD_INDEX = True
+KEYWORD_DICT_PATH = './wc/user_dict.txt'
+KEYWORD_INDEX_STEP = 60
+
+# 打分结果：把原始事件、过滤结果与每条弹幕的情感分数保存到输出目录的 scored_run.bin；
+# 之后改了阈值或过滤规则可用 python main.py --replay output/scored_run.bin 秒级重出全部报表，只对新通过过滤的弹幕打分
+SCORED_RUN = True
+
+# 运行报告：各阶段的墙钟/CPU 时间、条数、吞吐、峰值内存以及过滤与缓存统计，写入输出目录的 run_report.json
+RUN_REPORT = True
+# 对单个阶段做 cProfile 分析（阶段名见运行报告，如 'sentiment'、'stat_time_trend'），None 为不分析
+PROFILE_STAGE = None
 
 # ==========================================
 
+def classify_score(sentiment_score):
+    if sentiment_score > POSITIVE_THRESHOLD:
+        return 'positive'
+    elif sentiment_score < NEGATIVE_THRESHOLD:
+        return 'negative'
+    return 'neutral'
+
+def classify_scores(scores):
+    """classify_score 的数组版本，返回 SENTIMENT_TYPES 中的类别编码"""
+    types = np.full(len(scores), SENTIMENT_CODES['neutral'], dtype=np.int8)
+    types[scores > POSITIVE_THRESHOLD] = SENTIMENT_CODES['positive']
+    types[scores < NEGATIVE_THRESHOLD] = SENTIMENT_CODES['negative']
+    return types
+
+# 报表（按运行顺序）；NEEDS_PROCESSING 中的报表依赖有效弹幕筛选与情感分析
+REPORTS = ('stat_overview', 'stat_top_danmaku_users', 'stat_top_gift_users', 'stat_all_sc', 'stat_effective_count',
+           'stat_sentiment_overview', 'stat_sentiment_users', 'stat_time_trend', 'export_debug_files', 'export_columnar',
+           'export_keyword_index')
+NEEDS_PROCESSING = {'stat_effective_count', 'stat_sentiment_overview', 'stat_sentiment_users', 'stat_time_trend',
+                    'export_debug_files', 'export_columnar', 'export_keyword_index'}
+# 按有效弹幕条数计吞吐的报表
+PER_EFFECTIVE = ('export_debug_files', 'export_columnar', 'export_keyword_index')
+
 class BilibiliLiveAnalyzer:
-    def __init__(self, xml_file_path, output_folder='output'):
+    def __init__(self, xml_file_path, output_folder='output', workers=SENTIMENT_WORKERS, chunksize=SENTIMENT_CHUNKSIZE,
+                 backend=SENTIMENT_BACKEND, trend_start_ts=TREND_START_TS):
         self.xml_file_path = xml_file_path
         self.output_folder = output_folder
-        self.danmakus = [] 
-        self.gifts = []    
-        self.regex_list = [re.compile(p) for p in INVALID_REGEX_PATTERNS]
-        
-        self.effective_danmakus = [] 
-        self.user_stats = defaultdict(lambda: {'name': '', 'msgs': []}) 
+        self.workers = workers
+        self.chunksize = chunksize
+        self.backend = backend
+        self.batch_engine = None
+        self.trend_start_ts = trend_start_ts
+        self.store = EventStore()
+        self.filter = DanmakuFilter(INVALID_REGEX_PATTERNS)
+        self.sentiment_cache = None
+        self.near_dup = None
+        self.aggregates = None
+        self.instrument = StageRecorder(PROFILE_STAGE, output_folder)
+        self.uid_anonymizer = PM9Cache(keep_invalid=True) if ANONYMIZE_UIDS else None
         
         if not os.path.exists(output_folder):
             os.makedirs(output_folder)
 
 
-    def load_and_parse(self):
-        """模块1：数据加载与解析"""
+    def load_and_parse(self, streaming=True, use_cache=None):
+        """模块1：数据加载与解析（默认流式解析，PARSE_WORKERS > 1 时对大文件分块并行解析；streaming=False 时走整树解析用于对照）
+        use_cache 为 True 时优先从 XML 旁的解析缓存加载，解析成功后写入缓存；为 None 时按调用时的 ARCHIVE_CACHE"""
+        use_cache = ARCHIVE_CACHE if use_cache is None else use_cache
         print(f"正在加载文件: {self.xml_file_path} ...")
-        try:
-            tree = ET.parse(self.xml_file_path)
-            root = tree.getroot()
-            
-            for child in root.findall('d'):
-                attr = child.attrib
-                p_attr = attr.get('p', '').split(',')
-                uid = attr.get('uid') or (p_attr[6] if len(p_attr) > 6 else '0')
-                ts = attr.get('timestamp') or (p_attr[4] if len(p_attr) > 4 else '0')
-                
-                self.danmakus.append({
-                    'text': str(child.text).strip(),
-                    'uid': uid,
-                    'user': attr.get('user', '未知用户'),
-                    'timestamp': float(ts),
-                    'is_gift': False
-                })
-
-            for child in root.findall('s'):
-                attr = child.attrib
-                self.gifts.append({
-                    'text': child.text if child.text else '', 
-                    'uid': attr.get('uid'),
-                    'user': attr.get('username'),
-                    'price': float(attr.get('price', 0)),
-                    'num': int(attr.get('num', 1)),
-                    'giftname': attr.get('giftname'),
-                    'timestamp': float(attr.get('timestamp', 0)),
-                    'is_gift': True
-                })
+        cached = archive_cache.load(self.xml_file_path) if use_cache else None
+        if cached is not None:
+            self.store = cached
+            print(f"解析完成。弹幕数: {self.store.n_danmaku}, 礼物记录数: {self.store.n_gift}")
+            return
+
+        store = parse_parallel(self.xml_file_path, PARSE_WORKERS) if streaming else None
+        if store is not None:
+            self.store = store
+            print(f"解析完成（{PARSE_WORKERS} 进程）。弹幕数: {self.store.n_danmaku}, 礼物记录数: {self.store.n_gift}")
+        else:
+            self.store = EventStore()
+            try:
+                for tag, record in self.iter_records(streaming):
+                    self.store.add(tag, record)
+                    
+                print(f"解析完成。弹幕数: {self.store.n_danmaku}, 礼物记录数: {self.store.n_gift}")
                 
-            print(f"解析完成。弹幕数: {len(self.danmakus)}, 礼物记录数: {len(self.gifts)}")
-            
-        except Exception as e:
-            print(f"解析XML出错: {e}")
+            except Exception as e:
+                print(f"解析XML出错: {e}")
+                use_cache = False
+            self.store.finalize()
+        if use_cache:
+            archive_cache.save(self.store, self.xml_file_path)
+
+    def iter_records(self, streaming=True):
+        """逐条产出 (tag, record)，tag 为 'd'（弹幕）或 's'（礼物/SC）"""
+        if streaming:
+            return iter_records(self.xml_file_path)
+        return iter_records_tree(self.xml_file_path)
 
     def _is_effective(self, text):
-        if not text: return False
-        for pattern in self.regex_list:
-            if pattern.search(text):
-                return False
-        return True
+        return self.filter.is_effective(text)
 
     def process_data(self):
-        """模块2：数据预处理（适配嵌套结构 + 宽松逻辑）"""
+        """模块2：数据预处理（有效标记与情感分数直接写回列式事件库）"""
         print("正在筛选有效弹幕...")
         
-        pending_process = []
-        for d in self.danmakus:
-            self.user_stats[d['uid']]['name'] = d['user']
-            self.user_stats[d['uid']]['msgs'].append(d['text'])
-            if self._is_effective(d['text']):
-                pending_process.append(d)
+        store = self.store
+        self.aggregates = None
+        texts = store.danmaku_texts()
+        with self.instrument.stage('filter', items=len(texts)):
+            store.effective[:] = self.filter.filter_mask(texts)
+        self.filter.print_stats()
+        self.instrument.add_metrics('filter', self.filter.report())
+        effective_idx = store.effective_indices()
         
-        print(f"有效弹幕筛选完毕，共 {len(pending_process)} 条，准备进行情感分析...")
+        print(f"有效弹幕筛选完毕，共 {len(effective_idx)} 条，准备进行情感分析...")
 
-        # 1. 批量推理
+        # 1. 批量推理（相同文本只推理一次）
+        self._sentiment_cache()
         start_time = time.time()
         
-        for i, d in enumerate(pending_process):
-            # 打印进度
-            if (i + 1) % 1000 == 0:
-                print(f"已处理 {i + 1}/{len(pending_process)} 条弹幕...")
-            
-            text = d['text']
-            
-            # 使用SnowNLP进行情感分析
-            s = SnowNLP(text)
-            # s.sentiments 的返回值是一个介于0和1之间的浮点数，越接近1越积极
-            sentiment_score = s.sentiments
+        score_texts = [texts[i] for i in effective_idx.tolist()]
+        if NEAR_DUP_COLLAPSE:
+            # 每条弹幕换成其所在簇的代表文本，打分时相同文本只推理一次
+            self.near_dup = NearDuplicateCollapser(NEAR_DUP_JACCARD, NEAR_DUP_LENGTH_RATIO)
+            with self.instrument.stage('near_dup', items=len(effective_idx)):
+                rep_codes = collapse_codes(self.near_dup, store.danmaku['text'][effective_idx], store.texts.values)
+                score_texts = [store.texts.values[c] for c in rep_codes.tolist()]
+            print(self.near_dup.summary())
+            self.instrument.add_metrics('near_dup', self.near_dup.report())
+
+        with self.instrument.stage('sentiment', items=len(effective_idx)):
+            # 使用SnowNLP进行情感分析（经缓存，可选多进程）
+            # 分数与 SnowNLP(text).sentiments 相同，是一个介于0和1之间的浮点数，越接近1越积极
+            scores = self.sentiment_cache.score_batch(score_texts, self._batch_scorer())
+            scores = np.array(scores, dtype=np.float64)
 
             # 根据分数分类
-            if sentiment_score > 0.65:
-                sentiment_type = 'positive'
-            elif sentiment_score < 0.35:
-                sentiment_type = 'negative'
-            else:
-                sentiment_type = 'neutral'
-        
-            # 更新数据
-            d_processed = d.copy()
-            d_processed.update({
-                'sentiment_score': sentiment_score,
-                'sentiment_type': sentiment_type,
-                'raw_label': sentiment_type
-            })
-            self.effective_danmakus.append(d_processed)
+            store.sentiment_score[effective_idx] = scores
+            store.sentiment_type[effective_idx] = classify_scores(scores)
         
         end_time = time.time()
         print(f"情感分析完成，耗时: {end_time - start_time:.2f}秒")
-        print(f"处理完成，有效弹幕库已生成。")
+        print(self.sentiment_cache.summary())
+        self.instrument.add_metrics('sentiment_cache', self.sentiment_cache.report())
+        if self.batch_engine is not None:
+            self.instrument.add_metrics('batch_scorer', self.batch_engine.report())
+        self.sentiment_cache.save()
+        print(f"处理完成，有效弹幕库已生成（列数据 {store.nbytes() / 1024 / 1024:.1f} MB）。")
+
+    def _sentiment_cache(self):
+        if self.sentiment_cache is None:
+            self.sentiment_cache = SentimentCache(MODEL_PATH, SENTIMENT_CACHE_SIZE, SENTIMENT_DISK_CACHE, self.backend)
+        return self.sentiment_cache
+
+    def _batch_scorer(self):
+        """返回批量打分函数：batch 后端为向量化打分，多进程模式为进程池，串行模式返回 None"""
+        if self.backend == 'batch':
+            if self.batch_engine is None:
+                from nb_scorer import BatchSentimentScorer
+                self.batch_engine = BatchSentimentScorer.load(MODEL_PATH)
+            return self.batch_engine.score
+        if self.workers <= 1:
+            return None
+        from sentiment_pool import score_parallel
+        return partial(score_parallel, model_path=MODEL_PATH, workers=self.workers, chunksize=self.chunksize)
 
     def _format_freq_list(self, msg_list):
         c = Counter(msg_list)
         items = [f"{k}({v}次)" for k, v in c.most_common()]
         return " | ".join(items)
 
+    def _aggregates(self):
+        """一次聚合得到所有报表需要的累加器（首次调用时计算，process_data 后失效）"""
+        if self.aggregates is None:
+            self.aggregates = ReportAggregates(self.store, self.trend_start_ts, (TREND_STEP,) + tuple(TREND_EXTRA_STEPS))
+        return self.aggregates
+
+    def _user_row(self, group):
+        """弹幕用户分组 -> (UID, 最后使用的用户名, 所有弹幕频率列表)"""
+        store = self.store
+        agg = self._aggregates()
+        uid_code = int(agg.danmaku_users.keys[group])
+        name = store.users.values[store.danmaku['user'][agg.danmaku_users.last[group]]]
+        texts = store.texts.values
+        freq = " | ".join(f"{texts[t]}({n}次)" for t, n in agg.user_texts.most_common(uid_code))
+        return store.uids.values[uid_code], name, freq
+
     def write_csv(self, filename, headers, rows):
-        path = os.path.join(self.output_folder, filename)
-        with open(path, 'w', newline='', encoding='utf-8-sig') as f:
-            writer = csv.writer(f)
-            writer.writerow(headers)
-            writer.writerows(rows)
+        """rows 可以是生成器，逐行写出（带缓冲，按 OUTPUT_COMPRESSION 压缩）"""
+        path = output_writer.write_csv(os.path.join(self.output_folder, filename), headers, rows, OUTPUT_COMPRESSION)
         print(f"已生成: {path}")
 
     # ================= 统计模块 =================
 
     def stat_overview(self):
-        total_d = len(self.danmakus)
-        danmaku_senders_uids = set(d['uid'] for d in self.danmakus)
-        total_d_senders = len(danmaku_senders_uids)
-        
-        gift_value_no_sc = 0.0
-        gift_senders_uids = set()
-        sc_value = 0.0
-        sc_count = 0
-        
-        for g in self.gifts:
-            val = g['price'] * g['num']
-            if g['giftname'] == '醒目留言':
-                sc_value += val
-                sc_count += 1
-            else:
-                gift_value_no_sc += val
-                gift_senders_uids.add(g['uid'])
-        
-        rows = [[total_d, total_d_senders, round(gift_value_no_sc, 2), len(gift_senders_uids), round(sc_value, 2), sc_count]]
+        agg = self._aggregates()
+        rows = [[self.store.n_danmaku, len(agg.danmaku_users), round(agg.gift_value_no_sc, 2), agg.gift_senders, round(agg.sc_value, 2), agg.sc_count]]
         self.write_csv('1_总体统计.csv', ['总弹幕数', '弹幕发送人数', '礼物总价值(无SC)', '送礼人数', 'SC总价值', 'SC总数量'], rows)
 
     def stat_top_danmaku_users(self):
-        sorted_users = sorted(self.user_stats.items(), key=lambda x: len(x[1]['msgs']), reverse=True)[:20]
-        rows = [[uid, data['name'], len(data['msgs']), self._format_freq_list(data['msgs'])] for uid, data in sorted_users]
+        users = self._aggregates().danmaku_users
+        rows = []
+        for group in top_k(users.counts, users.first, 20).tolist():
+            uid, name, freq = self._user_row(group)
+            rows.append([uid, name, int(users.counts[group]), freq])
         self.write_csv('2_弹幕发送Top20.csv', ['UID', '用户名', '发送数量', '弹幕频率列表'], rows)
 
     def stat_top_gift_users(self):
-        gift_users = defaultdict(lambda: {'name': '', 'total_value': 0, 'gifts': []})
-        for g in self.gifts:
-            val = g['price'] * g['num']
-            gift_users[g['uid']]['name'] = g['user']
-            gift_users[g['uid']]['total_value'] += val
-            gift_users[g['uid']]['gifts'].append(f"{g['giftname']}x{g['num']}")
-        
-        sorted_gifts = sorted(gift_users.items(), key=lambda x: x[1]['total_value'], reverse=True)[:20]
-        rows = [[uid, data['name'], round(data['total_value'], 2), self._format_freq_list(data['gifts'])] for uid, data in sorted_gifts]
+        store = self.store
+        g = store.gift
+        agg = self._aggregates()
+        users = agg.gift_users
+        rows = []
+        for group in top_k(agg.gift_totals, users.first, 20).tolist():
+            idx = users.members(group)
+            name = store.users.values[g['user'][users.last[group]]]
+            gifts = [f"{store.giftnames.values[n]}x{num}" for n, num in zip(g['giftname'][idx].tolist(), g['num'][idx].tolist())]
+            rows.append([store.uids.values[users.keys[group]], name, round(float(agg.gift_totals[group]), 2), self._format_freq_list(gifts)])
         self.write_csv('3_礼物贡献Top20.csv', ['UID', '用户名', '礼物总价值', '礼物列表'], rows)
 
     def stat_all_sc(self):
-        sc_list = sorted([g for g in self.gifts if g['giftname'] == '醒目留言'], key=lambda x: x['price'], reverse=True)
-        rows = [[sc['uid'], sc['user'], sc['price'], sc['text']] for sc in sc_list]
+        store = self.store
+        g = store.gift
+        sc_idx = self._aggregates().sc_order
+        rows = ([store.uids.values[u], store.users.values[n], price, store.texts.values[t]]
+                for u, n, price, t in zip(g['uid'][sc_idx].tolist(), g['user'][sc_idx].tolist(),
+                                          g['price'][sc_idx].tolist(), g['text'][sc_idx].tolist()))
         self.write_csv('4_所有SC记录.csv', ['UID', '用户名', '价值', '留言内容'], rows)
 
     def stat_effective_count(self):
-        self.write_csv('5_有效弹幕统计.csv', ['有效弹幕数量'], [[len(self.effective_danmakus)]])
+        self.write_csv('5_有效弹幕统计.csv', ['有效弹幕数量'], [[self._aggregates().effective_count]])
 
     def stat_sentiment_overview(self):
-        if not self.effective_danmakus: return
-        scores = [d['sentiment_score'] for d in self.effective_danmakus]
-        types = [d['sentiment_type'] for d in self.effective_danmakus]
-        c = Counter(types)
-        avg_score = sum(scores) / len(scores)
+        agg = self._aggregates()
+        if not agg.effective_count: return
+        c = agg.sentiment_counts
+        avg_score = agg.score_sum / agg.effective_count
         rows = [[c['positive'], c['negative'], c['neutral'], round(avg_score, 4)]]
         self.write_csv('6_情感分析总览.csv', ['积极数量', '消极数量', '中性数量', '平均情感置信度'], rows)
 
     def stat_sentiment_users(self):
-        neg_users = defaultdict(int)
-        neu_users = defaultdict(int)
-        for d in self.effective_danmakus:
-            if d['sentiment_type'] == 'negative': neg_users[d['uid']] += 1
-            elif d['sentiment_type'] == 'neutral': neu_users[d['uid']] += 1
-        
+        agg = self._aggregates()
         rows = []
-        for uid, count in sorted(neg_users.items(), key=lambda x: x[1], reverse=True)[:5]:
-            rows.append(['消极Top5', uid, self.user_stats[uid]['name'], count, self._format_freq_list(self.user_stats[uid]['msgs'])])
-        for uid, count in sorted(neu_users.items(), key=lambda x: x[1], reverse=True)[:3]:
-            rows.append(['中性Top3', uid, self.user_stats[uid]['name'], count, self._format_freq_list(self.user_stats[uid]['msgs'])])
+        for label, stype, k in (('消极Top5', 'negative', 5), ('中性Top3', 'neutral', 3)):
+            users = agg.sentiment_users[stype]
+            for group in top_k(users.counts, users.first, k).tolist():
+                uid, name, freq = self._user_row(agg.danmaku_users.find(users.keys[group]))
+                rows.append([label, uid, name, int(users.counts[group]), freq])
         self.write_csv('7_特定情感倾向用户Top.csv', ['榜单类型', 'UID', '用户名', '特定情感弹幕数', '所有弹幕列表'], rows)
 
     def stat_time_trend(self):
-        # 请根据你的视频实际开始时间修改这里！
-        START_TS = 1764932400 
-        STEP = 30
-        
-        timestamps = [d['timestamp'] for d in self.danmakus] + [g['timestamp'] for g in self.gifts]
-        if not timestamps: timestamps = [START_TS]
-        end_ts = max(timestamps)
-        
-        data_buckets = defaultdict(lambda: {'d_count': 0, 'd_pos': 0, 'd_neg': 0, 'd_neu': 0, 'g_val': 0.0})
-
-        def get_bucket_index(ts):
-            if ts < START_TS: return -1
-            return int((ts - START_TS) / STEP)
-
-        for d in self.danmakus:
-            idx = get_bucket_index(d['timestamp'])
-            if idx >= 0: data_buckets[idx]['d_count'] += 1
-        
-        for d in self.effective_danmakus:
-            idx = get_bucket_index(d['timestamp'])
-            if idx >= 0:
-                if d['sentiment_type'] == 'positive':
-                    data_buckets[idx]['d_pos'] += 1
-                elif d['sentiment_type'] == 'negative':
-                    data_buckets[idx]['d_neg'] += 1
-                else:
-                    data_buckets[idx]['d_neu'] += 1
-
-        for g in self.gifts:
-            idx = get_bucket_index(g['timestamp'])
-            if idx >= 0:
-                data_buckets[idx]['g_val'] += (g['price'] * g['num'])
-
-        rows = []
-        start_dt_str = datetime.fromtimestamp(START_TS).strftime('%H:%M:%S')
-        rows.append([start_dt_str, 0, 0, 0, 0, 0, 0.0, 0.0])
-
-        total_intervals = int((end_ts - START_TS) / STEP) + 1
-        acc_d_count = 0
-        acc_g_val = 0.0
-        
-        for i in range(total_intervals + 1):
-            curr = data_buckets[i]
-            acc_d_count += curr['d_count']
-            acc_g_val += curr['g_val']
-            
-            end_of_interval_ts = START_TS + ((i + 1) * STEP) 
-            dt_str = datetime.fromtimestamp(end_of_interval_ts).strftime('%H:%M:%S')
-            
-            rows.append([
-                dt_str, 
-                curr['d_count'],            
-                curr['d_pos'],              
-                curr['d_neu'],              
-                curr['d_neg'],              
-                acc_d_count,                
-                round(curr['g_val'] / 100, 2), 
-                round(acc_g_val / 100, 2)      
-            ])
-
-        headers = ['时间轴', '当前30s总弹幕数', '积极弹幕数', '中性弹幕数', '消极弹幕数', '累计弹幕数', '当前30s礼物(元)', '累计礼物(元)']
-        self.write_csv('8_趋势统计_详细情感.csv', headers, rows)
+        agg = self._aggregates()
+        if agg.trend is None:
+            print("没有任何事件，跳过趋势统计。")
+            return
+        if self.trend_start_ts is None:
+            print(f"自动检测趋势起始时间: {datetime.fromtimestamp(agg.trend_start_ts).strftime('%Y-%m-%d %H:%M:%S')}")
+
+        for step, rows in agg.trend.items():
+            headers = ['时间轴', f'当前{step}s总弹幕数', '积极弹幕数', '中性弹幕数', '消极弹幕数', '累计弹幕数', f'当前{step}s礼物(元)', '累计礼物(元)']
+            filename = '8_趋势统计_详细情感.csv' if step == TREND_STEP else f'8_趋势统计_详细情感_{step}s.csv'
+            self.write_csv(filename, headers, rows)
 
     def export_debug_files(self):
-        """新增任务：导出分类后的文本用于人工核查"""
+        """新增任务：导出分类后的文本用于人工核查（按类别逐行流式写出，不在内存中拼接整份文件）"""
         files = {
             'positive': 'debug_positive.txt',   # 积极
             'negative': 'debug_negative.txt',   # 消极
             'neutral':  'debug_neutral.txt'     # 中性
         }
         
-        # 准备容器
-        data_map = defaultdict(list)
-        
-        for d in self.effective_danmakus:
-            stype = d['sentiment_type']
-            
-            # 格式设计: [置信度] 文本
-            # 例如: [0.9982] 这种垃圾游戏赶紧倒闭吧
-            # 保留4位小数，方便你观察那些 0.59 vs 0.61 的临界值数据
-            line = f"[{d['sentiment_score']:.4f}] {d['text']}"
-            data_map[stype].append(line)
+        store = self.store
+        effective_idx = store.effective_indices()
+        types = store.sentiment_type[effective_idx]
+        values = store.texts.values
             
         # 分别写入三个文件
         for stype, filename in files.items():
-            path = os.path.join(self.output_folder, filename)
-            content_list = data_map[stype]
-            
+            idx = effective_idx[types == SENTIMENT_CODES[stype]]
+
             # 可选：按分数排序，方便观察 (消极按分数低到高，积极按分数高到低)
-            # if stype == 'positive':
-            #     content_list.sort(key=lambda x: float(x[1:7]), reverse=True)
-            # elif stype == 'negative':
-            #     content_list.sort(key=lambda x: float(x[1:7]))
-
-            with open(path, 'w', encoding='utf-8') as f:
-                # 写入头部说明
-                f.write(f"=== {stype} 类别 (共 {len(content_list)} 条) ===\n")
-                f.write("格式: [模型置信度] 弹幕内容\n")
-                f.write("说明: 0接近纯消极，1接近纯积极。中性通常是因为分数在0.4-0.6之间。\n")
-                f.write("--------------------------------------------------\n")
-                
-                # 写入所有内容
-                f.write('\n'.join(content_list))
-                
+            # order = np.argsort(store.sentiment_score[idx], kind='stable')
+            # idx = idx[order[::-1]] if stype == 'positive' else idx[order]
+
+            scores = store.sentiment_score[idx].tolist()
+            codes = store.danmaku['text'][idx].tolist()
+            
+            # 格式设计: [置信度] 文本
+            # 例如: [0.9982] 这种垃圾游戏赶紧倒闭吧
+            # 保留4位小数，方便你观察那些 0.59 vs 0.61 的临界值数据
+            lines = (f"[{score:.4f}] {values[code]}" for score, code in zip(scores, codes))
+
+            # 头部说明
+            header = (f"=== {stype} 类别 (共 {len(idx)} 条) ===\n"
+                      "格式: [模型置信度] 弹幕内容\n"
+                      "说明: 0接近纯消极，1接近纯积极。中性通常是因为分数在0.4-0.6之间。\n"
+                      "--------------------------------------------------\n")
+            path = output_writer.write_lines(os.path.join(self.output_folder, filename), header, lines,
+                                             OUTPUT_COMPRESSION)
             print(f"已生成人工核查文件: {path}")
 
-    def run_all(self):
-        self.load_and_parse()
-        self.process_data()
-        self.stat_overview()
-        self.stat_top_danmaku_users()
-        self.stat_top_gift_users()
-        self.stat_all_sc()
-        self.stat_effective_count()
-        self.stat_sentiment_overview()
-        self.stat_sentiment_users()
-        self.stat_time_trend()
-        self.export_debug_files()
+    def export_columnar(self):
+        """列式输出有效弹幕表（时间戳、UID、用户名、文本、情感分数与类别），看板可直接加载，不用再解析 CSV"""
+        if COLUMNAR_OUTPUT is None:
+            return
+        store = self.store
+        table = output_writer.effective_table(store, SENTIMENT_TYPES)
+        path = output_writer.write_columnar(os.path.join(self.output_folder, '有效弹幕'), table, COLUMNAR_OUTPUT)
+        print(f"已生成列式输出: {path}")
+
+    def export_keyword_index(self):
+        """关键词倒排索引（词典词条与任意子串的分桶命中数、平均情感与命中弹幕），供 keyword_index.py 查询"""
+        if not KEYWORD_INDEX:
+            return
+        if os.path.exists(KEYWORD_DICT_PATH):
+            terms = keyword_index.load_terms(KEYWORD_DICT_PATH)
+        else:
+            print(f"未找到用户词典 {KEYWORD_DICT_PATH}，关键词索引只支持子串查询。")
+            terms = []
+        index = keyword_index.KeywordIndex.build(self.store, terms, KEYWORD_INDEX_STEP)
+        index.save(os.path.join(self.output_folder, keyword_index.FILENAME))
+
+    def write_run_report(self):
+        """运行报告：阶段耗时与各项统计，写到 CSV 旁边"""
+        self.instrument.add_metrics('input', {
+            'xml_file': self.xml_file_path,
+            'danmaku': self.store.n_danmaku,
+            'gift': self.store.n_gift,
+            'distinct_texts': len(self.store.texts),
+            'effective': int(self.store.effective.sum()) if self.store.effective is not None else 0,
+            'backend': self.backend,
+            'workers': self.workers,
+        })
+        print(self.instrument.summary())
+        self.instrument.write(os.path.join(self.output_folder, 'run_report.json'))
+
+    def _scored_run_meta(self):
+        return {
+            'xml_file': self.xml_file_path,
+            'model': f"{model_digest(MODEL_PATH)}:{self.backend}",
+            'patterns': list(INVALID_REGEX_PATTERNS),
+            'positive_threshold': POSITIVE_THRESHOLD,
+            'negative_threshold': NEGATIVE_THRESHOLD,
+            'near_dup_collapse': NEAR_DUP_COLLAPSE,
+        }
+
+    def save_scored_run(self, scores=None):
+        """保存打分结果供回放；scores 默认为本次的情感分数（未打分的为 NaN）"""
+        scores = self.store.sentiment_score if scores is None else scores
+        with self.instrument.stage('save_scored_run', items=self.store.n_danmaku):
+            scored_run.save(os.path.join(self.output_folder, scored_run.FILENAME), self.store, scores,
+                            self._scored_run_meta())
+
+    def replay(self, scored_run_path, only=None):
+        """回放：载入已打分的运行结果，按当前的过滤规则与阈值重新生成报表，只对新通过过滤、还没有分数的弹幕打分"""
+        reports = self._select_reports(only)
+        stage = self.instrument.stage
+        overwrite = SCORED_RUN and os.path.abspath(scored_run_path) == os.path.abspath(
+            os.path.join(self.output_folder, scored_run.FILENAME))
+        with stage('load_scored_run') as rec:
+            self.store, scores, meta = scored_run.load(scored_run_path, in_memory=overwrite)
+            rec['items'] = self.store.n_danmaku + self.store.n_gift
+        self._anonymize()
+        self.xml_file_path = meta['xml_file']
+        self.aggregates = None
+        store = self.store
+        texts = store.danmaku_texts()
+
+        if meta['patterns'] == list(INVALID_REGEX_PATTERNS):
+            print("过滤规则未变，沿用保存的过滤结果。")
+        else:
+            print("过滤规则已修改，重新筛选有效弹幕...")
+            with stage('filter', items=len(texts)):
+                store.effective[:] = self.filter.filter_mask(texts)
+            self.filter.print_stats()
+            self.instrument.add_metrics('filter', self.filter.report())
+        effective_idx = store.effective_indices()
+
+        new_idx = effective_idx[np.isnan(scores[effective_idx])]
+        print(f"有效弹幕 {len(effective_idx)} 条，其中新通过过滤需要打分 {len(new_idx)} 条。")
+        if len(new_idx):
+            if meta['model'] != f"{model_digest(MODEL_PATH)}:{self.backend}":
+                print("注意：当前模型/后端与保存打分结果时不同，新打分的弹幕与已有分数来自不同模型。")
+            cache = self._sentiment_cache()
+            with stage('sentiment', items=len(new_idx)):
+                scores[new_idx] = cache.score_batch([texts[i] for i in new_idx.tolist()], self._batch_scorer())
+            print(cache.summary())
+            self.instrument.add_metrics('sentiment_cache', cache.report())
+            cache.save()
+
+        # 按当前阈值分类
+        store.sentiment_score[effective_idx] = scores[effective_idx]
+        store.sentiment_type[effective_idx] = classify_scores(scores[effective_idx])
+        print(f"按阈值 积极 > {POSITIVE_THRESHOLD}、消极 < {NEGATIVE_THRESHOLD} 重新分类。")
+        if SCORED_RUN:
+            self.save_scored_run(scores)
+        self._write_reports(reports)
+
+    def _anonymize(self):
+        """ANONYMIZE_UIDS 时把事件库的 UID 表换成摘要（已是摘要的值原样保留），之后的输出都不含原始 UID"""
+        if self.uid_anonymizer is not None:
+            anonymize_store(self.store, self.uid_anonymizer)
+
+    def _select_reports(self, only=None):
+        reports = [r for r in REPORTS if only is None or r in only]
+        if COLUMNAR_OUTPUT is None and 'export_columnar' in reports:
+            reports.remove('export_columnar')
+        if not KEYWORD_INDEX and 'export_keyword_index' in reports:
+            reports.remove('export_keyword_index')
+        return reports
+
+    def run_all(self, only=None):
+        """运行全部报表；only 为报表名列表时只运行这些（都不需要情感分析时跳过过滤与情感打分，不加载模型）"""
+        reports = self._select_reports(only)
+        stage = self.instrument.stage
+        with stage('load_and_parse') as rec:
+            self.load_and_parse()
+            rec['items'] = self.store.n_danmaku + self.store.n_gift
+        self._anonymize()
+        if any(r in NEEDS_PROCESSING for r in reports):
+            self.process_data()
+            if SCORED_RUN:
+                self.save_scored_run()
+        self._write_reports(reports)
+
+    def _write_reports(self, reports):
+        stage = self.instrument.stage
+        with stage('aggregate', items=self.store.n_danmaku + self.store.n_gift):
+            self._aggregates()
+        for name in reports:
+            with stage(name, items=int(self.store.effective.sum()) if name in PER_EFFECTIVE else None):
+                getattr(self, name)()
+        if RUN_REPORT:
+            self.write_run_report()
         print("所有统计任务完成！")
 
 if __name__ == "__main__":
-    xml_path = 'input.xml' 
-    tool = BilibiliLiveAnalyzer(xml_path)
-    tool.run_all()
\ No newline at end of file
+    import argparse
+    ap = argparse.ArgumentParser(description='B 站直播弹幕分析')
+    ap.add_argument('xml', nargs='?', default='input.xml')
+    ap.add_argument('--output', default='output')
+    ap.add_argument('--only', nargs='+', choices=REPORTS, help='只生成这些报表，如 --only stat_overview stat_all_sc')
+    ap.add_argument('--replay', metavar='SCORED_RUN', help='回放已保存的打分结果（如 output/scored_run.bin），按当前的过滤规则与阈值重出报表')
+    ap.add_argument('--positive', type=float, help='覆盖 POSITIVE_THRESHOLD')
+    ap.add_argument('--negative', type=float, help='覆盖 NEGATIVE_THRESHOLD')
+    args = ap.parse_args()
+    if args.positive is not None:
+        POSITIVE_THRESHOLD = args.positive
+    if args.negative is not None:
+        NEGATIVE_THRESHOLD = args.negative
+    tool = BilibiliLiveAnalyzer(args.xml, args.output)
+    if args.replay:
+        tool.replay(args.replay, args.only)
+    else:
+        tool.run_all(args.only)
\ No newline at end of file
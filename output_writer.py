@@ -0,0 +1,139 @@
+import csv
+import gzip
+import io
+import os
+
+import numpy as np
+
+# 输出写入：CSV / 核查文件按行流式写出（带缓冲，可选 gzip / zstd 压缩），
+# 以及有效弹幕表的列式输出（npz，或安装了 pyarrow 时的 Parquet），供看板直接加载。
+# zstd 与 Parquet 为可选依赖：Python 3.14+ 自带 compression.zstd，否则需要 pip install zstandard / pyarrow。
+
+COMPRESSION_SUFFIXES = {None: '', 'gzip': '.gz', 'zstd': '.zst'}
+BUFFER_SIZE = 1 << 20
+LINES_PER_WRITE = 10000
+
+
+def output_path(path, compression=None):
+    if compression not in COMPRESSION_SUFFIXES:
+        raise ValueError(f"不支持的压缩格式: {compression}（可选 None / 'gzip' / 'zstd'）")
+    return path + COMPRESSION_SUFFIXES[compression]
+
+
+def open_text(path, compression=None, encoding='utf-8'):
+    """以文本模式打开输出文件（path 需已带压缩后缀），newline='' 交给调用方（csv 模块）处理换行"""
+    if compression is None:
+        return open(path, 'w', newline='', encoding=encoding, buffering=BUFFER_SIZE)
+    if compression == 'gzip':
+        # 压缩级别 6：比默认的 9 快得多，体积只大一点
+        raw = gzip.open(path, 'wb', compresslevel=6)
+    else:
+        try:
+            from compression import zstd
+            raw = zstd.open(path, 'wb')
+        except ImportError:
+            try:
+                import zstandard
+            except ImportError:
+                raise ImportError("zstd 压缩需要 Python 3.14+ 或 pip install zstandard") from None
+            raw = zstandard.open(path, 'wb')
+    return io.TextIOWrapper(io.BufferedWriter(raw, BUFFER_SIZE), encoding=encoding, newline='')
+
+
+def write_csv(path, headers, rows, compression=None):
+    """rows 可以是生成器，边产生边写出；返回实际写入的路径"""
+    path = output_path(path, compression)
+    with open_text(path, compression, encoding='utf-8-sig') as f:
+        writer = csv.writer(f)
+        writer.writerow(headers)
+        writer.writerows(rows)
+    return path
+
+
+def write_lines(path, header, lines, compression=None):
+    """写出 header 后接以换行分隔的 lines（末行后没有换行，与 '\\n'.join 的结果相同），分批写出不整体拼接"""
+    path = output_path(path, compression)
+    with open_text(path, compression) as f:
+        f.write(header)
+        batch = []
+        first = True
+        for line in lines:
+            batch.append(line)
+            if len(batch) >= LINES_PER_WRITE:
+                f.write(('' if first else '\n') + '\n'.join(batch))
+                first = False
+                batch = []
+        if batch:
+            f.write(('' if first else '\n') + '\n'.join(batch))
+    return path
+
+
+def _compact(codes, values):
+    """只保留用到的字典项，返回 (新编码, 字典值列表)"""
+    used, inverse = np.unique(codes, return_inverse=True)
+    return inverse.astype(np.int32), [values[c] for c in used.tolist()]
+
+
+def effective_table(store, sentiment_types):
+    """有效弹幕表：时间戳、uid/用户名/文本（字典编码）、情感分数与类别"""
+    idx = store.effective_indices()
+    d = store.danmaku
+    uid_codes, uids = _compact(d['uid'][idx], store.uids.values)
+    user_codes, users = _compact(d['user'][idx], store.users.values)
+    text_codes, texts = _compact(d['text'][idx], store.texts.values)
+    return {
+        'timestamp': d['timestamp'][idx],
+        'uid': (uid_codes, uids),
+        'user': (user_codes, users),
+        'text': (text_codes, texts),
+        'sentiment_score': store.sentiment_score[idx],
+        'sentiment_type': (store.sentiment_type[idx].astype(np.int32), list(sentiment_types)),
+    }
+
+
+def write_npz(path, table):
+    """字典编码列存为 <列>_code 与 <列>_values 两个数组，可用 np.load(path) 直接加载（不需要 pickle）"""
+    arrays = {}
+    for name, col in table.items():
+        if isinstance(col, tuple):
+            codes, values = col
+            arrays[f'{name}_code'] = codes
+            arrays[f'{name}_values'] = np.array(['' if v is None else v for v in values], dtype=str)
+        else:
+            arrays[name] = col
+    np.savez_compressed(path, **arrays)
+    return path
+
+
+def write_parquet(path, table):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("Parquet 输出需要 pip install pyarrow（或改用 npz）") from None
+    columns = {}
+    for name, col in table.items():
+        if isinstance(col, tuple):
+            codes, values = col
+            columns[name] = pa.DictionaryArray.from_arrays(pa.array(codes), pa.array(values, type=pa.string()))
+        else:
+            columns[name] = pa.array(col)
+    pq.write_table(pa.table(columns), path, compression='zstd')
+    return path
+
+
+COLUMNAR_WRITERS = {'npz': write_npz, 'parquet': write_parquet}
+
+
+def write_columnar(path_base, table, fmt):
+    """fmt 为 'npz' 或 'parquet'，返回写入的路径"""
+    if fmt not in COLUMNAR_WRITERS:
+        raise ValueError(f"不支持的列式格式: {fmt}（可选 'npz' / 'parquet'）")
+    path = f"{path_base}.{fmt}"
+    tmp_path = path + '.tmp'
+    COLUMNAR_WRITERS[fmt](tmp_path, table)
+    # np.savez 会给没有 .npz 后缀的文件名补上后缀
+    if fmt == 'npz' and not os.path.exists(tmp_path):
+        tmp_path += '.npz'
+    os.replace(tmp_path, path)
+    return path
@@ -0,0 +1,114 @@
+import mmap
+import multiprocessing
+import os
+import re
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+from danmaku_xml import DanmakuPullParser
+from event_store import Categorical, EventStore
+
+# 多进程分块解析：把 XML 内存映射后在根节点子元素 <d>/<s> 的起始处切成若干字节区间，
+# 每块补上根节点的开闭标签后交给工作进程用 DanmakuPullParser 解析，返回局部字典编码的列式批次；
+# 主进程按块顺序合并字典表并重映射编码。字典项按首次出现的顺序编号，与串行解析得到的事件库完全相同。
+# 切分点若落在注释、CDATA 或嵌套元素中，该块必然不完整而解析失败，此时返回 None，由调用方改用串行解析。
+
+# 小于该大小的文件直接串行解析（进程启动与合并的开销大于收益）
+MIN_PARALLEL_BYTES = 8 << 20
+# 每个工作进程分到的块数（块略多于进程数，便于负载均衡）
+CHUNKS_PER_WORKER = 4
+# 工作进程每次送入解析器的字节数（与 iterparse 相同量级；送入过多时一次产生大量未释放的节点，反而更慢）
+FEED_BYTES = 1 << 14
+
+_ROOT_RE = re.compile(rb'<(?![?!])([^\s/>]+)')
+_ELEMENT_RE = re.compile(rb'<[ds][\s/>]')
+_ENCODING_RE = re.compile(rb'^<\?xml[^>]*encoding=["\']([^"\']+)["\']')
+# 列名 -> 字典表
+_COLUMN_TABLES = {'uid': 'uids', 'user': 'users', 'text': 'texts', 'giftname': 'giftnames'}
+
+
+def split_ranges(mm, n_chunks):
+    """返回 (根标签名, [(起, 止), ...])；切分点都在 <d / <s 处，第一块从文件头开始，最后一块到文件尾。
+    不是 UTF-8 编码或找不到根节点时返回 None"""
+    enc = _ENCODING_RE.match(mm)
+    if enc and enc.group(1).lower().replace(b'_', b'-') not in (b'utf-8', b'utf8'):
+        return None
+    root = _ROOT_RE.search(mm)
+    if root is None:
+        return None
+    size = len(mm)
+    bounds = [0]
+    for k in range(1, n_chunks):
+        m = _ELEMENT_RE.search(mm, max(size * k // n_chunks, root.end(), bounds[-1] + 1))
+        if m is None:
+            break
+        if m.start() > bounds[-1]:
+            bounds.append(m.start())
+    bounds.append(size)
+    return root.group(1), list(zip(bounds[:-1], bounds[1:]))
+
+
+def _add_records(store, records):
+    for tag, record in records:
+        store.add(tag, record)
+
+
+def _parse_range(args):
+    """工作进程：解析 [start, end) 区间，返回局部编码的列与字典表；块不完整时返回 None"""
+    xml_path, root_tag, start, end, is_first, is_last = args
+    parser = DanmakuPullParser()
+    store = EventStore()
+    with open(xml_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        try:
+            if not is_first:
+                _add_records(store, parser.feed(b'<' + root_tag + b'>'))
+            for pos in range(start, end, FEED_BYTES):
+                _add_records(store, parser.feed(mm[pos:min(pos + FEED_BYTES, end)]))
+            if not is_last:
+                _add_records(store, parser.feed(b'</' + root_tag + b'>'))
+            _add_records(store, parser.close())
+        except ET.ParseError:
+            return None
+    store.finalize()
+    return (store.danmaku, store.gift, store.texts.values, store.uids.values, store.users.values,
+            store.giftnames.values)
+
+
+def merge_batches(batches):
+    """按块顺序合并局部批次：各字典表依次并入全局表，局部编码经查表映射为全局编码"""
+    tables = {name: Categorical() for name in ('texts', 'uids', 'users', 'giftnames')}  # 顺序与批次中的字典表一致
+    columns = {'danmaku': {}, 'gift': {}}
+    for danmaku, gift, *values in batches:
+        maps = {}
+        for name, local in zip(tables, values):
+            table = tables[name]
+            maps[name] = np.array([table.code(v) for v in local], dtype=np.int32)
+        for kind, cols in (('danmaku', danmaku), ('gift', gift)):
+            for col, arr in cols.items():
+                table = _COLUMN_TABLES.get(col)
+                if table is not None and len(arr):
+                    arr = maps[table][arr]
+                columns[kind].setdefault(col, []).append(arr)
+    danmaku = {col: np.concatenate(parts) for col, parts in columns['danmaku'].items()}
+    gift = {col: np.concatenate(parts) for col, parts in columns['gift'].items()}
+    return EventStore.from_columns(danmaku, gift, **{name: t.values for name, t in tables.items()})
+
+
+def parse_parallel(xml_path, workers, min_bytes=None):
+    """多进程解析为 EventStore；进程数不足 2、文件小于 min_bytes（默认 MIN_PARALLEL_BYTES）或无法安全切分时返回 None（调用方改用串行解析）"""
+    min_bytes = MIN_PARALLEL_BYTES if min_bytes is None else min_bytes
+    if workers <= 1 or os.path.getsize(xml_path) < min_bytes:
+        return None
+    with open(xml_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        split = split_ranges(mm, workers * CHUNKS_PER_WORKER)
+    if split is None or len(split[1]) < 2:
+        return None
+    root_tag, ranges = split
+    tasks = [(xml_path, root_tag, start, end, i == 0, i == len(ranges) - 1) for i, (start, end) in enumerate(ranges)]
+    with multiprocessing.Pool(min(workers, len(tasks))) as pool:
+        batches = pool.map(_parse_range, tasks, chunksize=1)
+    if any(batch is None for batch in batches):
+        print("分块解析失败（切分点不在顶层元素之间），改用串行解析。")
+        return None
+    return merge_batches(batches)
@@ -0,0 +1,38 @@
+import os
+
+import numpy as np
+
+import archive_cache
+
+# 已打分的运行结果：原始事件（与解析缓存相同的列与字典表）、每条弹幕的过滤结果与情感分数，
+# 连同生成时的过滤规则、阈值与模型写成一个文件（输出目录下的 scored_run.bin），加载时内存映射。
+# 回放（main.py --replay）按新的阈值/过滤规则直接重出报表，只有新通过过滤、还没有分数的弹幕需要推理。
+# 分数列保留打过分的所有弹幕（包括之后被过滤掉的），过滤规则改回去时不必重新打分；没打过分为 NaN。
+
+MAGIC = b'HSRSCR01'
+FILENAME = 'scored_run.bin'
+
+
+def save(path, store, scores, meta):
+    """scores 为与弹幕等长的分数数组（NaN 为未打分），meta 为生成时的配置"""
+    arrays = archive_cache.store_arrays(store)
+    arrays['result.effective'] = store.effective.astype(np.uint8)
+    arrays['result.score'] = np.asarray(scores, dtype=np.float64)
+    archive_cache.write_arrays(path, {'meta': meta}, arrays, MAGIC)
+    print(f"打分结果已保存: {path}（{os.path.getsize(path) / 1024 / 1024:.1f} MB）")
+
+
+def load(path, in_memory=False):
+    """返回 (EventStore, 分数数组, meta)；事件库的有效标记为保存时的过滤结果，分数数组可写。
+    in_memory 为 True 时把各列复制到内存、不保留映射（之后要覆盖写同一文件时使用，Windows 上不能替换仍被映射的文件）"""
+    with open(path, 'rb') as f:
+        header = archive_cache.read_header(f, MAGIC)
+        if header is None:
+            raise ValueError(f"{path} 不是打分结果文件")
+        arrays = archive_cache.map_arrays(f, header, MAGIC)
+    if in_memory:
+        arrays = {name: np.array(arr) for name, arr in arrays.items()}
+    store = archive_cache.store_from_arrays(arrays)
+    store.effective[:] = arrays['result.effective'].astype(bool)
+    print(f"已加载打分结果: {path}（弹幕 {store.n_danmaku} 条，已打分 {int(np.count_nonzero(~np.isnan(arrays['result.score'])))} 条）")
+    return store, arrays['result.score'].copy(), header['meta']
@@ -0,0 +1,166 @@
+import hashlib
+import marshal
+import os
+import sys
+from collections import OrderedDict
+
+# 已加载到 snownlp.sentiment 的模型路径
+_loaded_model = None
+
+
+def sentiment_model(model_path=None):
+    """首次用到时才导入 snownlp（导入时会加载分词与词性模型，需数秒）并加载情感模型，返回 snownlp.sentiment 模块。
+    model_path 为 None 时沿用已加载的模型（从未加载过则为 snownlp 自带模型）；同一路径只加载一次。"""
+    global _loaded_model
+    from snownlp import sentiment
+    if model_path is not None and model_path != _loaded_model:
+        sentiment.load(model_path)
+        _loaded_model = model_path
+    return sentiment
+
+
+def normalize_text(text):
+    """缓存键：只去掉首尾空白。
+    再做其他归一化（大小写、全半角等）会改变分词结果，分数就不再与原文一致了。"""
+    return text.strip()
+
+
+def model_file_of(model_path):
+    """snownlp 在 Python3 下实际读写的是 model_path + '.3'"""
+    if sys.version_info[0] == 3 and os.path.exists(model_path + '.3'):
+        return model_path + '.3'
+    return model_path
+
+
+def model_digest(model_path):
+    """模型文件内容的 sha1，用于绑定磁盘缓存"""
+    h = hashlib.sha1()
+    with open(model_file_of(model_path), 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+class SentimentCache:
+    """情感分数缓存：相同文本只推理一次，内存中为有上限的 LRU，可选落盘（与模型文件绑定）。
+    read_only 为 True 时只读取磁盘缓存、不写回（多个进程共用同一缓存文件时，由主进程合并 new_scores 后统一保存）"""
+
+    def __init__(self, model_path=None, maxsize=200000, disk_cache=False, backend='snownlp', read_only=False):
+        self.model_path = model_path
+        self.maxsize = maxsize
+        self.read_only = read_only
+        # 本次新推理的分数
+        self.new_scores = {}
+        self.hits = 0
+        self.misses = 0
+        self._store = OrderedDict()
+        self.cache_path = None
+        self.model_id = None
+        if disk_cache and model_path:
+            # 不同后端的分数在末位可能有差异，分开缓存（各用一个文件，切换后端不会丢弃另一个后端的缓存）
+            self.cache_path = f"{model_file_of(model_path)}.{backend}.scores"
+            self.model_id = f"{model_digest(model_path)}:{backend}"
+            self.load()
+
+    def score(self, text):
+        """返回与 SnowNLP(text).sentiments 完全一致的分数"""
+        key = normalize_text(text)
+        store = self._store
+        if key in store:
+            self.hits += 1
+            store.move_to_end(key)
+            return store[key]
+        self.misses += 1
+        # 等价于 SnowNLP(text).sentiments，省去 SnowNLP 构造时的 BM25 初始化
+        value = sentiment_model(self.model_path).classify(key)
+        store[key] = value
+        self.new_scores[key] = value
+        if len(store) > self.maxsize:
+            store.popitem(last=False)
+        return value
+
+    def score_batch(self, texts, batch_scorer=None, progress_every=1000):
+        """批量打分：未命中的文本去重后统一推理，返回与 texts 顺序一致的分数列表。
+        batch_scorer 接收文本列表、返回等长分数列表（如进程池），为空时逐条串行推理。"""
+        keys = [normalize_text(t) for t in texts]
+        store = self._store
+        known = {}
+        missing = []
+        for key in keys:
+            if key in known:
+                self.hits += 1
+            elif key in store:
+                self.hits += 1
+                store.move_to_end(key)
+                known[key] = store[key]
+            else:
+                self.misses += 1
+                known[key] = None
+                missing.append(key)
+
+        if batch_scorer is not None:
+            values = batch_scorer(missing)
+        else:
+            values = []
+            classify = sentiment_model(self.model_path).classify if missing else None
+            for i, key in enumerate(missing):
+                if progress_every and (i + 1) % progress_every == 0:
+                    print(f"已推理 {i + 1}/{len(missing)} 条（去重后）...")
+                values.append(classify(key))
+
+        for key, value in zip(missing, values):
+            known[key] = value
+            store[key] = value
+            self.new_scores[key] = value
+            if len(store) > self.maxsize:
+                store.popitem(last=False)
+        return [known[key] for key in keys]
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def load(self):
+        """读取磁盘缓存，模型不一致时丢弃"""
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return
+        try:
+            with open(self.cache_path, 'rb') as f:
+                data = marshal.load(f)
+        except Exception as e:
+            print(f"读取情感缓存失败，忽略: {e}")
+            return
+        if data.get('model') != self.model_id:
+            print("情感缓存与当前模型不匹配，已忽略。")
+            return
+        for key, value in data['scores'].items():
+            self._store[key] = value
+            if len(self._store) > self.maxsize:
+                self._store.popitem(last=False)
+        print(f"已加载情感缓存 {len(self._store)} 条: {self.cache_path}")
+
+    def merge(self, scores):
+        """并入其他进程推理出的分数 {文本: 分数}"""
+        store = self._store
+        for key, value in scores.items():
+            store[key] = value
+            store.move_to_end(key)
+            if len(store) > self.maxsize:
+                store.popitem(last=False)
+
+    def save(self):
+        if not self.cache_path or self.read_only:
+            return
+        tmp_path = self.cache_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            marshal.dump({'model': self.model_id, 'scores': dict(self._store)}, f)
+        os.replace(tmp_path, self.cache_path)
+        print(f"情感缓存已保存 {len(self._store)} 条: {self.cache_path}")
+
+    def report(self):
+        """命中统计（供运行报告使用）"""
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': round(self.hit_rate(), 4),
+                'size': len(self._store), 'maxsize': self.maxsize, 'disk_cache': self.cache_path}
+
+    def summary(self):
+        return f"缓存命中 {self.hits} 次，未命中 {self.misses} 次，命中率 {self.hit_rate():.2%}"
@@ -0,0 +1,30 @@
+import multiprocessing
+
+from sentiment_cache import sentiment_model
+
+# 多进程情感推理：每个工作进程启动时加载一次模型（以 fork 启动且父进程已加载同一模型时直接复用），按输入顺序返回分数
+
+_classify = None
+
+
+def _init_worker(model_path):
+    global _classify
+    _classify = sentiment_model(model_path).classify
+
+
+def _score(text):
+    return _classify(text)
+
+
+def score_parallel(texts, model_path, workers=None, chunksize=500, progress_every=1000):
+    """将 texts 分片到进程池推理，返回与 texts 顺序一致的分数列表"""
+    workers = workers or multiprocessing.cpu_count()
+    total = len(texts)
+    scores = []
+    with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(model_path,)) as pool:
+        # imap 保证结果按输入顺序返回
+        for i, score in enumerate(pool.imap(_score, texts, chunksize)):
+            scores.append(score)
+            if progress_every and (i + 1) % progress_every == 0:
+                print(f"已推理 {i + 1}/{total} 条（{workers} 进程）...")
+    return scores
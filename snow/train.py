@@ -1,23 +1,100 @@
+import argparse
+import codecs
+import hashlib
+import json
+import os
+import sys
+import time
+
 from snownlp import sentiment
+from snownlp.classification.bayes import Bayes
+
+# 批量评估复用项目根目录下的 nb_scorer（评估时才导入）
+PROJECT_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
 
 # --- 配置参数 ---
 POS_FILE = 'data/pos.txt'       # 标注好的积极评论文件
 NEG_FILE = 'data/neg.txt'       # 标注好的消极评论文件
 MODEL_FILE = 'hsr3.8.marshal' # 训练好的新模型保存路径
+EVAL_POS_FILE = 'data/eval_pos.txt'   # 留出的积极评估样本（不参与训练）
+EVAL_NEG_FILE = 'data/eval_neg.txt'   # 留出的消极评估样本
+
+# 用法：
+#   python train.py                  # 从头训练（原逻辑）
+#   python train.py update           # 增量训练：在已有模型上只加入 pos.txt / neg.txt 中新追加的样本
+#   python train.py update --base hsr3.8.marshal --out hsr3.9.marshal
+#   python train.py update --pos new_pos.txt --neg new_neg.txt   # 把单独的新样本文件整体并入
+#   （没有 .train.json 的模型——如旧脚本训练的 hsr3.8.marshal——不知道哪些样本已训练过，只能这样用只含新样本的文件更新）
+#   python train.py eval --model hsr3.9.marshal
+#
+# 增量训练：朴素贝叶斯的模型就是各类别的词频计数，在旧模型上累加新样本的词频，与用全部样本从头训练得到的模型完全相同，
+# 只需对新样本分词。模型旁的 .train.json 记录已并入的样本（文件路径、行数与这些行的 sha1），
+# 下次 update 时只读取追加的行；已训练过的行被修改时提示从头训练。
+
+
+def read_lines(path):
+    """与 sentiment.train 相同的读法（codecs.readlines），保证增量训练与从头训练切分出的样本一致"""
+    with codecs.open(path, 'r', 'utf-8') as f:
+        return f.readlines()
+
+
+def lines_digest(lines):
+    h = hashlib.sha1()
+    for line in lines:
+        h.update(line.encode('utf-8'))
+    return h.hexdigest()
+
+
+def manifest_path_of(model_file):
+    return model_file + '.train.json'
+
+
+def load_manifest(model_file):
+    """模型旁的训练记录；没有记录（旧脚本训练的模型）时返回 None"""
+    path = manifest_path_of(model_file)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_manifest(model_file, manifest):
+    with open(manifest_path_of(model_file), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+
+def tokenize_docs(docs, label, handle):
+    """分词并打上标签；相同的样本只分词一次（样本重复出现时词频照常累加）"""
+    memo = {}
+    data = []
+    for doc in docs:
+        words = memo.get(doc)
+        if words is None:
+            words = memo[doc] = handle(doc)
+        data.append([words, label])
+    return data
+
 
 def train_new_model():
     """使用标注好的文件训练并保存一个新的情感分析模型。"""
     print("开始训练新的 SnowNLP 模型...")
     print(f"使用积极样本: {POS_FILE}")
     print(f"使用消极样本: {NEG_FILE}")
-    
+
     try:
         sentiment.train(NEG_FILE, POS_FILE)
         print(f"\n训练完成！")
-        
+
         sentiment.save(MODEL_FILE)
         print(f"新模型已成功保存到 -> {MODEL_FILE}")
-        
+
+        # 记录已训练的样本，之后追加样本时可以增量训练
+        sources = {}
+        for label, path in (('pos', POS_FILE), ('neg', NEG_FILE)):
+            lines = read_lines(path)
+            sources[path] = {'label': label, 'lines': len(lines), 'sha1': lines_digest(lines)}
+        save_manifest(MODEL_FILE, {'base': None, 'sources': sources})
+
         print("\n--- 如何使用新模型 ---")
         print("在您的分析代码中，请在使用 SnowNLP 前加入以下两行：")
         print("from snownlp import SnowNLP")
@@ -31,5 +108,116 @@ def train_new_model():
         print(f"\n训练过程中发生错误: {e}")
         print("请检查 pos.txt 和 neg.txt 文件是否存在且包含内容。")
 
+
+def update_model(base_file=MODEL_FILE, out_file=None, pos_file=None, neg_file=None):
+    """增量训练：加载 base_file，只把 pos_file / neg_file（默认 POS_FILE / NEG_FILE）中尚未训练过的行加入词频计数，保存为 out_file。
+    base_file 没有训练记录时无法区分哪些样本已训练过，必须显式给出只含新样本的文件（只并入给出的文件）"""
+    out_file = out_file or base_file
+    manifest = load_manifest(base_file)
+    untracked = manifest is None or manifest.get('untracked_base', False)
+    if untracked:
+        if pos_file is None and neg_file is None:
+            reason = "没有训练记录" if manifest is None else "的训练记录不完整（最初的基础模型没有训练记录）"
+            raise ValueError(f"{base_file} {reason}（{manifest_path_of(base_file)}），无法判断 {POS_FILE} / {NEG_FILE} "
+                             "中哪些样本已训练过，直接更新会重复计数。请用 --pos / --neg 指定只含新样本的文件，"
+                             "或从头训练（python train.py）。")
+        files = [(label, path) for label, path in (('pos', pos_file), ('neg', neg_file)) if path is not None]
+    else:
+        files = [('pos', pos_file or POS_FILE), ('neg', neg_file or NEG_FILE)]
+    started = time.time()
+    bayes = Bayes()
+    bayes.load(base_file)
+    print(f"已加载基础模型: {base_file}（{time.time() - started:.2f} 秒）")
+
+    new_docs = {'pos': [], 'neg': []}
+    sources = dict(manifest['sources']) if manifest is not None else {}
+    for label, path in files:
+        lines = read_lines(path)
+        seen = sources.get(path)
+        done = 0
+        if seen is not None:
+            if seen['label'] != label:
+                raise ValueError(f"{path} 之前作为 {seen['label']} 样本训练过，不能再作为 {label} 样本。")
+            if seen['lines'] > len(lines) or lines_digest(lines[:seen['lines']]) != seen['sha1']:
+                raise ValueError(f"{path} 中已训练过的样本被修改或删除，无法增量训练，请从头训练（python train.py）。")
+            done = seen['lines']
+        new_docs[label] = lines[done:]
+        sources[path] = {'label': label, 'lines': len(lines), 'sha1': lines_digest(lines)}
+        print(f"{path}: 已训练 {done} 条，新增 {len(lines) - done} 条")
+
+    n_new = sum(len(docs) for docs in new_docs.values())
+    if not n_new:
+        print("没有新增样本，模型未改变。")
+        return bayes
+
+    t0 = time.time()
+    # 与 Sentiment.train 相同：先消极后积极，分词方式与 Sentiment.handle 一致
+    handle = sentiment.classifier.handle
+    data = tokenize_docs(new_docs['neg'], 'neg', handle) + tokenize_docs(new_docs['pos'], 'pos', handle)
+    t1 = time.time()
+    bayes.train(data)
+    t2 = time.time()
+    bayes.save(out_file)
+    # 基础模型没有训练记录时，记录中只有之后并入的文件，后续更新同样只接受显式给出的文件
+    save_manifest(out_file, {'base': base_file, 'untracked_base': untracked, 'sources': sources})
+    print(f"增量训练完成：新增 {n_new} 条样本，分词 {t1 - t0:.2f} 秒，更新词频 {t2 - t1:.2f} 秒，"
+          f"保存 {time.time() - t2:.2f} 秒")
+    print(f"新模型已保存到 -> {out_file}")
+    return bayes
+
+
+def evaluate(model, pos_file=EVAL_POS_FILE, neg_file=EVAL_NEG_FILE):
+    """批量评估：model 为模型路径或已加载的 Bayes，返回准确率与耗时（分数 > 0.5 判为积极，与 Bayes.classify 一致）"""
+    if PROJECT_ROOT not in sys.path:
+        sys.path.insert(0, PROJECT_ROOT)
+    from nb_scorer import BatchSentimentScorer
+
+    t0 = time.time()
+    scorer = BatchSentimentScorer.load(model) if isinstance(model, str) else BatchSentimentScorer(model)
+    t1 = time.time()
+    pos = [line.strip() for line in read_lines(pos_file) if line.strip()]
+    neg = [line.strip() for line in read_lines(neg_file) if line.strip()]
+    pos_scores = scorer.score(pos)
+    neg_scores = scorer.score(neg)
+    t2 = time.time()
+
+    tp = sum(1 for s in pos_scores if s > 0.5)
+    tn = sum(1 for s in neg_scores if s <= 0.5)
+    total = len(pos) + len(neg)
+    result = {
+        'samples': total,
+        'accuracy': round((tp + tn) / total, 4) if total else 0.0,
+        'pos_recall': round(tp / len(pos), 4) if pos else 0.0,
+        'neg_recall': round(tn / len(neg), 4) if neg else 0.0,
+        'load_seconds': round(t1 - t0, 3),
+        'score_seconds': round(t2 - t1, 3),
+        'samples_per_second': round(total / (t2 - t1), 1) if t2 > t1 else None,
+    }
+    print(f"评估样本 {total} 条（积极 {len(pos)}，消极 {len(neg)}）")
+    print(f"准确率 {result['accuracy']:.2%}，积极召回 {result['pos_recall']:.2%}，消极召回 {result['neg_recall']:.2%}")
+    print(f"加载模型 {result['load_seconds']} 秒，打分 {result['score_seconds']} 秒（{result['samples_per_second']} 条/秒）")
+    return result
+
+
 if __name__ == '__main__':
-    train_new_model()
\ No newline at end of file
+    ap = argparse.ArgumentParser(description='训练 / 增量训练 / 评估情感模型')
+    ap.add_argument('mode', nargs='?', default='train', choices=['train', 'update', 'eval'])
+    ap.add_argument('--base', default=MODEL_FILE, help='update：基础模型')
+    ap.add_argument('--out', default=None, help='update：新模型保存路径，默认覆盖基础模型')
+    ap.add_argument('--pos', default=None, help='积极样本文件（update 默认 POS_FILE，eval 默认 EVAL_POS_FILE）')
+    ap.add_argument('--neg', default=None, help='消极样本文件（update 默认 NEG_FILE，eval 默认 EVAL_NEG_FILE）')
+    ap.add_argument('--model', default=MODEL_FILE, help='eval：要评估的模型')
+    ap.add_argument('--eval', action='store_true', help='update 完成后用留出样本评估新模型')
+    args = ap.parse_args()
+
+    if args.mode == 'train':
+        train_new_model()
+    elif args.mode == 'update':
+        try:
+            model = update_model(args.base, args.out, args.pos, args.neg)
+        except ValueError as e:
+            sys.exit(f"无法增量训练: {e}")
+        if args.eval:
+            evaluate(model)
+    else:
+        evaluate(args.model, args.pos or EVAL_POS_FILE, args.neg or EVAL_NEG_FILE)
@@ -0,0 +1,119 @@
+import argparse
+import random
+from itertools import accumulate
+from xml.sax.saxutils import escape, quoteattr
+
+# 合成弹幕录播：按固定随机种子生成与 B 站录播格式一致的 XML（<d> 弹幕、<s> 礼物/SC），用于基准测试。
+# 相同的条数与种子生成的文件逐字节相同。
+# 文本的重复程度接近真实直播：大部分是少数热门弹幕（Zipf 分布），其余为热门弹幕的变体与长尾的随机组合；
+# 发言用户同样是少数活跃用户占大头。
+#   python synth_archive.py 100000 bench_data/synth_100k.xml
+
+START_TS = 1764932400 - 100      # 与 main.py 的 TREND_START_TS 对齐
+MESSAGES_PER_SECOND = 20         # 平均弹幕密度
+GIFT_RATIO = 0.03                # <s> 记录占比
+SC_RATIO = 0.15                  # <s> 记录中醒目留言的占比
+LEGACY_RATIO = 0.3               # 只有 p 属性、没有 uid/timestamp 属性的旧格式 <d> 占比
+BLOCK = 10000                    # 每批抽样的条数
+
+HOT_PHRASES = [
+    '好耶', '666', '哈哈哈哈哈', '？？？', '开门开门', '来了来了', '翁法罗斯来了', '黄金裔太帅了', '前瞻好看',
+    '卡池好烂', '这剧情不行', '期待新角色', '大家好', '烧鸡真不错', '垃圾活动', '我爱星穹铁道', '强度加强一下',
+    '太好了！', '一般般吧', '真的假的', '退坑了', '爽！', '这个角色好可爱啊啊啊', '记忆是梦的开场白', '与你共舞',
+    '[doge]', '[笑哭][笑哭]', '表情【滑稽】', 'abc123', '   ', '。。。', '草', '绷不住了', '有点东西', '好听',
+    '泪目', '来晚了', '主播好', '冲冲冲', '这波血赚', '米哈游你没有心', '什么时候复刻', '星琼不够了', '抽抽抽',
+    '画面好美', '配乐绝了', '剧情好刀', '这就是崩铁', '等不及了', '官方快点', '白嫖党狂喜', '又要攒星琼了',
+]
+WORDS = [
+    '角色', '剧情', '卡池', '活动', '版本', '前瞻', '主播', '星琼', '抽卡', '强度', '立绘', '配音', '音乐', '地图',
+    '任务', '开拓者', '列车', '星穹铁道', '翁法罗斯', '黄金裔', '烧鸡', '好看', '难受', '期待', '喜欢', '不行', '真好',
+    '太强了', '一般', '离谱', '感动', '可爱', '帅气', '复刻', '保底', '歪了', '出金', '今天', '明天', '终于', '还是',
+]
+SUFFIXES = ['!', '~', '哈哈', '！！', '啊啊啊', '。', '?']
+GIFTS = [('小心心', 0), ('辣条', 100), ('牛哇', 1000), ('打call', 5000), ('粉丝团灯牌', 100)]
+SC_PRICES = [30, 50, 100, 500, 1000]
+
+
+def zipf_weights(n, s=1.1):
+    return list(accumulate(1.0 / (i + 1) ** s for i in range(n)))
+
+
+def make_users(rnd, n):
+    users = []
+    for i in range(n):
+        uid = str(rnd.randint(1, 10 ** rnd.randint(3, 16)))
+        users.append((uid, f'用户{i}'))
+    return users
+
+
+def random_text(rnd):
+    """长尾弹幕：1~4 个词随机拼接，偶尔带数字"""
+    text = ''.join(rnd.choice(WORDS) for _ in range(rnd.randint(1, 4)))
+    if rnd.random() < 0.2:
+        text += str(rnd.randint(0, 999))
+    return text
+
+
+def pick_text(rnd, hot):
+    r = rnd.random()
+    if r < 0.6:
+        return hot
+    if r < 0.85:
+        return hot + rnd.choice(SUFFIXES)
+    return random_text(rnd)
+
+
+def generate(path, n, seed=0):
+    """生成 n 条记录（弹幕 + 礼物/SC）的合成录播，返回 (弹幕数, 礼物记录数)"""
+    rnd = random.Random(seed)
+    users = make_users(rnd, max(50, n // 15))
+    user_cum = zipf_weights(len(users), 0.9)
+    phrase_cum = zipf_weights(len(HOT_PHRASES))
+    interval = 2.0 / MESSAGES_PER_SECOND
+
+    n_danmaku = n_gift = 0
+    ts = float(START_TS)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<i>\n<chatserver>chat.bilibili.com</chatserver>\n')
+        for block_start in range(0, n, BLOCK):
+            k = min(BLOCK, n - block_start)
+            senders = rnd.choices(users, cum_weights=user_cum, k=k)
+            phrases = rnd.choices(HOT_PHRASES, cum_weights=phrase_cum, k=k)
+            lines = []
+            for (uid, name), hot in zip(senders, phrases):
+                ts += rnd.random() * interval
+                if rnd.random() < GIFT_RATIO:
+                    n_gift += 1
+                    if rnd.random() < SC_RATIO:
+                        giftname, price, num = '醒目留言', rnd.choice(SC_PRICES), 1
+                        text = escape(pick_text(rnd, hot))
+                    else:
+                        (giftname, price), num, text = rnd.choice(GIFTS), rnd.randint(1, 10), ''
+                    lines.append(f'<s username={quoteattr(name)} uid="{uid}" price="{price}" num="{num}" '
+                                 f'giftname="{giftname}" timestamp="{int(ts)}">{text}</s>\n')
+                    continue
+                n_danmaku += 1
+                text = escape(pick_text(rnd, hot))
+                if rnd.random() < LEGACY_RATIO:
+                    lines.append(f'<d p="{rnd.random() * 3600:.3f},1,25,16777215,{int(ts)},0,{uid},0" '
+                                 f'user={quoteattr(name)}>{text}</d>\n')
+                else:
+                    lines.append(f'<d p="{rnd.random() * 3600:.3f},1,25,16777215,{int(ts * 1000)},0,{uid},0" '
+                                 f'uid="{uid}" user={quoteattr(name)} timestamp="{ts:.3f}">{text}</d>\n')
+            f.write(''.join(lines))
+        f.write('</i>\n')
+    return n_danmaku, n_gift
+
+
+def main():
+    ap = argparse.ArgumentParser(description='生成合成弹幕录播 XML（用于基准测试）')
+    ap.add_argument('n', type=int, help='记录条数（弹幕 + 礼物/SC）')
+    ap.add_argument('output', help='输出 XML 路径')
+    ap.add_argument('--seed', type=int, default=0)
+    args = ap.parse_args()
+    n_danmaku, n_gift = generate(args.output, args.n, args.seed)
+    print(f"已生成: {args.output}（弹幕 {n_danmaku} 条，礼物/SC {n_gift} 条）")
+
+
+if __name__ == '__main__':
+    main()
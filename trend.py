@@ -0,0 +1,103 @@
+import math
+import time
+from datetime import datetime
+
+import numpy as np
+
+from event_store import SENTIMENT_CODES
+
+# 趋势统计的向量化分桶：所有事件一次 bincount 完成分桶，累计列用前缀和，时间标签批量格式化
+# 多个分桶粒度共用一次最细粒度（各粒度的最大公约数）的分桶结果
+
+
+def detect_start_ts(timestamps, step):
+    """自动检测起始时间：最早事件所在的整桶"""
+    if not len(timestamps):
+        return None
+    return int(math.floor(float(np.min(timestamps)) / step) * step)
+
+
+def bucket_index(ts, start_ts, step):
+    """与 int((ts - start_ts) / step) 一致，早于 start_ts 的记为 -1"""
+    idx = ((ts - start_ts) / step).astype(np.int64)
+    idx[ts < start_ts] = -1
+    return idx
+
+
+def format_labels(timestamps):
+    """批量格式化为本地时间 HH:MM:SS（与 datetime.fromtimestamp(ts).strftime('%H:%M:%S') 一致）"""
+    timestamps = np.asarray(timestamps, dtype=np.float64)
+    if not len(timestamps):
+        return []
+    first = time.localtime(float(timestamps.min())).tm_gmtoff
+    last = time.localtime(float(timestamps.max())).tm_gmtoff
+    if first != last:
+        # 区间内跨越夏令时切换，逐个格式化
+        return [datetime.fromtimestamp(t).strftime('%H:%M:%S') for t in timestamps.tolist()]
+    secs = np.floor(timestamps + first).astype(np.int64) % 86400
+    return [f"{s // 3600:02d}:{s // 60 % 60:02d}:{s % 60:02d}" for s in secs.tolist()]
+
+
+def parse_time(value, origin):
+    """HH:MM[:SS]（origin 当天的本地时间，早于 origin 时视为次日）或 Unix 时间戳"""
+    if ':' not in value:
+        return float(value)
+    h, m, s = ([int(p) for p in value.split(':')] + [0])[:3]
+    ts = datetime.fromtimestamp(origin).replace(hour=h, minute=m, second=s, microsecond=0).timestamp()
+    return ts + 86400 if ts < origin else ts
+
+
+def trend_rows(d_ts, eff_ts, eff_types, g_ts, g_vals, start_ts, steps):
+    """计算各粒度的趋势表，返回 {step: rows}，rows 与原 stat_time_trend 的输出逐行一致"""
+    steps = list(steps)
+    base = math.gcd(*(int(s) for s in steps)) if all(float(s).is_integer() for s in steps) else None
+
+    timestamps_max = [float(a.max()) for a in (d_ts, g_ts) if len(a)]
+    end_ts = max(timestamps_max) if timestamps_max else start_ts
+
+    def n_rows(step):
+        # 原逻辑：range(int((end_ts - START_TS) / STEP) + 1 + 1)
+        return max(int((end_ts - start_ts) / step) + 2, 0)
+
+    def binned(step, n_bins):
+        size = n_bins
+        d_idx = bucket_index(d_ts, start_ts, step)
+        d_count = np.bincount(d_idx[d_idx >= 0], minlength=size)[:size]
+        e_idx = bucket_index(eff_ts, start_ts, step)
+        keep = e_idx >= 0
+        senti = np.bincount(e_idx[keep] * 3 + eff_types[keep], minlength=size * 3)[:size * 3].reshape(size, 3)
+        g_idx = bucket_index(g_ts, start_ts, step)
+        keep = g_idx >= 0
+        # bincount 按记录顺序逐项累加，与逐条 += 一致
+        g_val = np.bincount(g_idx[keep], weights=g_vals[keep], minlength=size)[:size]
+        return d_count, senti, g_val
+
+    if base is not None:
+        # 一次最细粒度分桶，粗粒度由相邻细桶合并
+        n_base = max(n_rows(step) * (step // base) for step in steps)
+        fine = binned(base, n_base)
+
+    result = {}
+    for step in steps:
+        rows_n = n_rows(step)
+        if base is None:
+            d_count, senti, g_val = binned(step, rows_n)
+        elif step == base:
+            d_count, senti, g_val = (a[:rows_n] for a in fine)
+        else:
+            k = step // base
+            d_count, senti, g_val = (a[:rows_n * k].reshape(rows_n, k, *a.shape[1:]).sum(axis=1) for a in fine)
+
+        acc_d = np.cumsum(d_count)
+        acc_g = np.cumsum(g_val)
+        labels = format_labels([start_ts] + [start_ts + (i + 1) * step for i in range(rows_n)])
+
+        rows = [[labels[0], 0, 0, 0, 0, 0, 0.0, 0.0]]
+        pos = senti[:, SENTIMENT_CODES['positive']].tolist()
+        neu = senti[:, SENTIMENT_CODES['neutral']].tolist()
+        neg = senti[:, SENTIMENT_CODES['negative']].tolist()
+        for label, dc, p, nu, ng, ad, gv, ag in zip(labels[1:], d_count.tolist(), pos, neu, neg,
+                                                     acc_d.tolist(), g_val.tolist(), acc_g.tolist()):
+            rows.append([label, dc, p, nu, ng, ad, round(gv / 100, 2), round(ag / 100, 2)])
+        result[step] = rows
+    return result
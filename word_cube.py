@@ -0,0 +1,98 @@
+import math
+from collections import Counter
+
+import numpy as np
+
+from event_store import Categorical
+from trend import bucket_index, detect_start_ts
+
+# 分段词云的词频立方体：每种文本只分词一次，按 时间桶 × 词 存成稀疏矩阵（只存非零项）。
+# 非零项按 (词, 桶) 排序并做前缀和，桶区间 [b0, b1) 内每个词的次数 = 前缀和在区间两端之差（两次 searchsorted），
+# 任意时间段的词频与窗口长度、段数无关，生成多张分段词云的开销与生成一张相当。
+
+
+class WordCube:
+    """用法：
+        cube = WordCube.build(timestamps, text_ids, text_words, step=60)
+        cube.top(start_ts, end_ts, 300)     # 时间段 [start_ts, end_ts) 内的前 300 个词 {词: 次数}
+        cube.windows(300, 300)              # 每 5 分钟一段，[(段起始时间戳, {词: 次数})]
+    时间段边界按桶向外取整。次数相同的词按首次出现的顺序排列（与 Counter 的插入顺序一致）。"""
+
+    def __init__(self, words, origin, step, n_buckets, keys, cum):
+        self.words = words          # 词表，按首次出现的顺序编号
+        self.origin = origin        # 第 0 桶的起始时间戳
+        self.step = step
+        self.n_buckets = n_buckets
+        self.keys = keys            # 非零项的 词编号 * n_buckets + 桶号（升序）
+        self.cum = cum              # 非零项次数的前缀和（首项为 0）
+
+    @classmethod
+    def build(cls, timestamps, text_ids, text_words, step):
+        """timestamps / text_ids 为每条弹幕的时间戳与文本编号，text_words[i] 为第 i 种文本的分词结果"""
+        vocab = Categorical()
+        word_ids = np.array([vocab.code(w) for words in text_words for w in words], dtype=np.int64)
+        lengths = np.array([len(words) for words in text_words], dtype=np.int64)
+        offsets = np.zeros(len(text_words) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        text_ids = np.asarray(text_ids, dtype=np.int64)
+        if not len(timestamps):
+            return cls(vocab.values, 0, step, 0, np.zeros(0, dtype=np.int64), np.zeros(1, dtype=np.int64))
+        origin = detect_start_ts(timestamps, step)
+        buckets = bucket_index(timestamps, origin, step)
+        n_buckets = int(buckets.max()) + 1
+
+        # 每个 (桶, 文本) 的出现次数，再展开到文本中的每个词（同一文本中重复的词各计一次）
+        pairs, n = np.unique(buckets * len(text_words) + text_ids, return_counts=True)
+        pair_buckets, pair_texts = np.divmod(pairs, len(text_words))
+        lens = lengths[pair_texts]
+        pos = np.repeat(offsets[pair_texts] - (np.cumsum(lens) - lens), lens) + np.arange(int(lens.sum()))
+        cells = word_ids[pos] * n_buckets + np.repeat(pair_buckets, lens)
+        keys, inverse = np.unique(cells, return_inverse=True)
+        counts = np.bincount(inverse, weights=np.repeat(n, lens), minlength=len(keys)).astype(np.int64)
+        cum = np.zeros(len(keys) + 1, dtype=np.int64)
+        np.cumsum(counts, out=cum[1:])
+        return cls(vocab.values, origin, step, n_buckets, keys, cum)
+
+    def bucket_counts(self, b0, b1):
+        """桶区间 [b0, b1) 内每个词的次数（按词编号）"""
+        b0, b1 = max(b0, 0), min(b1, self.n_buckets)
+        if b0 >= b1:
+            return np.zeros(len(self.words), dtype=np.int64)
+        base = np.arange(len(self.words), dtype=np.int64) * self.n_buckets
+        return self.cum[np.searchsorted(self.keys, base + b1)] - self.cum[np.searchsorted(self.keys, base + b0)]
+
+    def bucket_range(self, start=None, end=None):
+        """时间段 [start, end) -> 覆盖它的桶区间；None 表示不限"""
+        b0 = 0 if start is None else math.floor((start - self.origin) / self.step)
+        b1 = self.n_buckets if end is None else math.ceil((end - self.origin) / self.step)
+        return b0, b1
+
+    def top(self, start=None, end=None, n=None):
+        """时间段内次数最多的 n 个词（n 为 None 时全部），{词: 次数} 按次数从高到低"""
+        counts = self.bucket_counts(*self.bucket_range(start, end))
+        ids = np.flatnonzero(counts)
+        if n is not None and len(ids) > n:
+            # 先按第 n 大的次数截掉尾部，再对剩下的排序
+            kth = np.partition(counts[ids], len(ids) - n)[len(ids) - n]
+            ids = ids[counts[ids] >= kth]
+        order = ids[np.lexsort((ids, -counts[ids]))][:n]
+        return {self.words[i]: int(counts[i]) for i in order.tolist()}
+
+    def totals(self):
+        """全场词频，Counter 的插入顺序为词首次出现的顺序（与逐条分词累加的结果一致）"""
+        counts = self.bucket_counts(0, self.n_buckets)
+        return Counter({self.words[i]: int(counts[i]) for i in np.flatnonzero(counts).tolist()})
+
+    def windows(self, seconds, n=None):
+        """按 seconds（须为 step 的整数倍）对齐整点切段，返回有词的各段 [(段起始时间戳, {词: 次数})]"""
+        if seconds % self.step:
+            raise ValueError(f"窗口长度须为分桶间隔 {self.step} 秒的整数倍")
+        result = []
+        first = math.floor(self.origin / seconds) * seconds
+        for start in range(first, self.origin + self.n_buckets * self.step, seconds):
+            counts = self.top(start, start + seconds, n)
+            if counts:
+                result.append((start, counts))
+        return result
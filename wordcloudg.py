@@ -1,12 +1,24 @@
-import xml.etree.ElementTree as ET
-import regex as re  # 注意：这里使用 regex 模块以支持 \p{P} 等高级正则
 import os
-import jieba
-from wordcloud import WordCloud, ImageColorGenerator
-import matplotlib.pyplot as plt
+import heapq
+import json
+import math
+import multiprocessing
+import time
 from collections import Counter
+from operator import itemgetter
 import numpy as np
 import random
+# jieba / wordcloud / matplotlib 导入较慢（合计约 1 秒），在分词、绘图时才导入
+
+import archive_cache
+from danmaku_filter import DanmakuFilter
+from danmaku_xml import iter_records
+from event_store import EventStore
+from instrument import StageRecorder
+from near_dup import NearDuplicateCollapser
+from parallel_xml import parse_parallel
+from trend import parse_time
+from word_cube import WordCube
 
 # ================= 配置区域 =================
 
@@ -18,6 +30,52 @@ STOPWORDS_PATH = 'wc/stopwords.txt'  # 停用词路径
 USER_DICT_PATH = 'wc/user_dict.txt'  # 自定义词典路径
 COLOR_IMAGE_PATH = 'wc/color.jpg'    # 颜色提供图片路径（可选，用于提供词云着色）
 
+# 解析缓存：与 main.py 共用 XML 旁的二进制列式缓存（input.xml.cache），第二次起跳过 XML 解析
+ARCHIVE_CACHE = True
+
+# 多进程解析：大文件按 <d>/<s> 边界切块并行解析（与 main.py 的 PARSE_WORKERS 相同），1 为串行
+PARSE_WORKERS = 1
+
+# 分词并行配置：进程数为 1 时在主进程分词；CHUNKSIZE 为每个任务包含的不同文本条数
+SEG_WORKERS = 1
+SEG_CHUNKSIZE = 2000
+
+# 分词词典缓存：主词典 + 自定义词典整体缓存在 USER_DICT_PATH 旁（wc/user_dict.txt.jieba），跳过 jieba 的逐词加载
+JIEBA_DICT_CACHE = True
+
+# 运行报告：各阶段耗时/吞吐/峰值内存与过滤统计写入输出目录的 run_report.json；
+# PROFILE_STAGE 指定单个阶段（'load_data'、'process_text'、'generate_wordcloud'）做 cProfile 分析
+RUN_REPORT = True
+PROFILE_STAGE = None
+
+# 近重复折叠（可选）：只差标点、叠字、表情后缀的变体与相似的复制粘贴刷屏归为一簇，每簇只对代表文本分词，按簇的总次数计词频
+NEAR_DUP_COLLAPSE = False
+# 归一化（去标点/表情/空白、叠字压缩）后相同的直接合并；不同的按字符二元组集合的 Jaccard 相似度合并，须同时满足：
+#   Jaccard 不低于 NEAR_DUP_JACCARD（19 字的句子改 1 个字约为 0.8），长度比（短 / 长）不低于 NEAR_DUP_LENGTH_RATIO，
+#   且数字串完全相同（'翁法罗斯179' 与 '翁法罗斯117' 不合并）；归一化后短于 6 个字的文本只做精确合并
+NEAR_DUP_JACCARD = 0.7
+NEAR_DUP_LENGTH_RATIO = 0.8
+
+# 无界面快速渲染：HEADLESS 为 True 时不弹出预览窗口、不导入 pyplot，matplotlib 固定使用 Agg 后端（服务器批量运行用）
+HEADLESS = False
+# 每张词云最多的词数（WordCloud 的 max_words）；布局前先把词频表裁剪到这么多词，取词结果不变，省去对整张词频表排序
+RENDER_TOP_N = 300
+# 布局缩放：为 2 时在 1/2 分辨率上布局再放大到输出尺寸，布局耗时约降到 1/9（字形边缘略粗）；1 为原样布局
+RENDER_SCALE = 1
+# 输出尺寸（宽, 高），可列出多个，如 ((1920, 1080), (1080, 1920), (800, 800))；第一个保存为 wordcloud_result.png
+RENDER_SIZES = ((1920, 1080),)
+# 按时间窗口（秒）额外生成分段词云，如 600；None 为不生成
+RENDER_WINDOW_SECONDS = None
+# 按指定时间段额外生成分段词云，如 (('20:00', '20:15'), ('20:15', '21:30'))；HH:MM[:SS] 为开播当天的本地时间，也可以写时间戳；() 为不生成
+RENDER_RANGES = ()
+# 分段词云的分桶间隔（秒）：分词只做一次，各桶词频存成稀疏矩阵（word_cube.py），任意时间段的词频由前缀和相减得到。
+# 时间段边界按桶向外取整；RENDER_WINDOW_SECONDS 不是它的整数倍时取两者的最大公约数
+WORD_CUBE_STEP = 60
+# 渲染进程数：多张图（多个尺寸或时间窗口）时并行渲染；1 为在主进程依次渲染
+RENDER_WORKERS = 1
+# 调色板缓存：COLOR_IMAGE_PATH 的降采样像素缓存在图片旁（wc/color.jpg.palette.json），图片修改时间或大小变化即重建
+PALETTE_CACHE = True
+
 # 过滤正则 (来自脚本1)
 INVALID_REGEX_PATTERNS = [
     r'^(\[[^\]]*\])+$',
@@ -33,12 +91,138 @@ INVALID_REGEX_PATTERNS = [
 
 # ==========================================
 
+def read_stopwords(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return {line.strip() for line in f}
+
+def segment(text, stopwords):
+    """分词并过滤，返回保留的词列表"""
+    import jieba
+    # 过滤逻辑：非停用词 且 长度>1 (去除单字)
+    return [w for w in jieba.lcut(text) if w not in stopwords and len(w) > 1 and w.strip() != '']
+
+def count_words(items, stopwords):
+    """对 (文本, 出现次数) 列表分词计数，每条文本只分词一次，按出现次数加权"""
+    c = Counter()
+    for text, n in items:
+        for w in segment(text, stopwords):
+            c[w] += n
+    return c
+
+# 分词工作进程：启动时各加载一次自定义词典与停用词
+_worker_stopwords = set()
+
+def _init_seg_worker(user_dict_path, stopwords_path, use_cache):
+    global _worker_stopwords
+    import jieba_cache
+    # fork 启动时继承主进程已准备好的分词器，这里直接返回
+    jieba_cache.prepare(user_dict_path, use_cache)
+    _worker_stopwords = read_stopwords(stopwords_path) or set()
+
+def _count_words_worker(items):
+    return count_words(items, _worker_stopwords)
+
+def _segment_worker(texts):
+    return [segment(text, _worker_stopwords) for text in texts]
+
+def prune_frequencies(word_counts, top_n):
+    """只保留词频最高的 top_n 个词；nlargest 与稳定排序同序，取词结果与 WordCloud 内部排序后截取相同"""
+    if len(word_counts) <= top_n:
+        return dict(word_counts)
+    return dict(heapq.nlargest(top_n, word_counts.items(), key=itemgetter(1)))
+
+def _palette_key(image_path):
+    st = os.stat(image_path)
+    return {'mtime_ns': st.st_mtime_ns, 'size': st.st_size}
+
+def load_palette_pixels(image_path, use_cache=True):
+    """颜色图片按 1/20 步长降采样后的像素（N x 3）；use_cache 时缓存在图片旁，以修改时间与大小为键"""
+    cache_path = image_path + '.palette.json'
+    key = _palette_key(image_path)
+    if use_cache and os.path.exists(cache_path):
+        try:
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('key') == key:
+                return np.array(data['pixels'], dtype=np.uint8).reshape(-1, 3)
+        except (OSError, ValueError) as e:
+            print(f"读取调色板缓存失败，忽略: {e}")
+
+    from PIL import Image
+    img_array = np.array(Image.open(image_path).convert('RGB'))
+    # 降采样以加快速度
+    h, w = img_array.shape[:2]
+    sample_h = max(1, h // 20)
+    sample_w = max(1, w // 20)
+    pixels = img_array[::sample_h, ::sample_w].reshape(-1, 3)
+    if use_cache:
+        try:
+            with open(cache_path, 'w', encoding='utf-8') as f:
+                json.dump({'key': key, 'pixels': pixels.tolist()}, f)
+        except OSError as e:
+            print(f"写入调色板缓存失败，忽略: {e}")
+    return pixels
+
+def random_color_func(color_list):
+    """创建随机颜色函数"""
+    if not color_list:
+        return None
+
+    def color_func(word=None, font_size=None, position=None, orientation=None,
+                   font_path=None, random_state=None):
+        """随机返回颜色列表中的一个颜色"""
+        color = random.choice(color_list)
+        return 'rgb({},{},{})'.format(color[0], color[1], color[2])
+
+    return color_func
+
+def use_headless_backend():
+    """固定使用非交互的 Agg 后端（须在导入 pyplot 之前调用）"""
+    import matplotlib
+    matplotlib.use('Agg')
+
+def render_cloud(job):
+    """渲染一张词云并保存，job 为字典：path、frequencies、max_words、width、height、scale、font_path、colors。返回 (路径, 耗时秒)"""
+    from wordcloud import WordCloud
+    started = time.perf_counter()
+    scale = job['scale']
+    wc = WordCloud(
+        font_path=job['font_path'],
+        background_color=None,  # 【关键1】背景色设为 None
+        mode="RGBA",             # 【关键2】模式设为 RGBA 以支持透明
+        stopwords=set(),
+        width=job['width'] // scale,    # 布局尺寸，输出时按 scale 放大
+        height=job['height'] // scale,
+        scale=scale,
+        max_words=job['max_words'],
+        min_word_length=2,
+        include_numbers=True,
+    )
+    # 根据词频生成
+    wc.generate_from_frequencies(job['frequencies'])
+    # 如果提供了颜色，则使用其颜色随机着色
+    if job['colors']:
+        wc.recolor(color_func=random_color_func(job['colors']))
+    wc.to_file(job['path'])
+    return job['path'], time.perf_counter() - started
+
+def _init_render_worker():
+    use_headless_backend()
+
 class BiliDanmakuWordCloud:
-    def __init__(self, xml_path):
+    def __init__(self, xml_path, workers=SEG_WORKERS, chunksize=SEG_CHUNKSIZE):
         self.xml_path = xml_path
-        self.regex_list = [re.compile(p) for p in INVALID_REGEX_PATTERNS]
+        self.workers = workers
+        self.chunksize = chunksize
+        self.filter = DanmakuFilter(INVALID_REGEX_PATTERNS)
         self.raw_texts = []
-        self.clean_words = []
+        self.raw_times = np.zeros(0)
+        self.word_counts = Counter()
+        self.representative = {}  # 近重复折叠时：文本 -> 簇代表文本
+        self.cube = None  # 需要分段词云时：时间桶 × 词 的词频立方体
+        self.instrument = StageRecorder(PROFILE_STAGE, OUTPUT_FOLDER)
         
         # 确保输出目录存在
         if not os.path.exists(OUTPUT_FOLDER):
@@ -46,35 +230,43 @@ class BiliDanmakuWordCloud:
 
     def load_stopwords(self):
         """加载停用词"""
-        stops = set()
-        if os.path.exists(STOPWORDS_PATH):
-            with open(STOPWORDS_PATH, 'r', encoding='utf-8') as f:
-                stops = {line.strip() for line in f}
+        stops = read_stopwords(STOPWORDS_PATH)
+        if stops is not None:
             print(f"已加载停用词库，共 {len(stops)} 个词。")
         else:
+            stops = set()
             print("警告：未找到停用词文件，将不使用停用词过滤。")
         return stops
 
     def load_data(self):
-        """加载并初步过滤XML数据 (参考脚本1逻辑)"""
+        """加载并初步过滤XML数据 (参考脚本1逻辑)，优先使用与 main.py 共用的解析缓存"""
         print(f"正在加载 XML 文件: {self.xml_path} ...")
         try:
-            tree = ET.parse(self.xml_path)
-            root = tree.getroot()
-            
-            count_total = 0
-            count_valid = 0
-            
-            for child in root.findall('d'):
-                text = str(child.text).strip()
-                count_total += 1
+            with self.instrument.stage('load_data') as rec:
+                store = archive_cache.load(self.xml_path) if ARCHIVE_CACHE else None
+                if store is None:
+                    store = parse_parallel(self.xml_path, PARSE_WORKERS)
+                    if store is None:
+                        store = EventStore()
+                        for tag, record in iter_records(self.xml_path):
+                            store.add(tag, record)
+                        store.finalize()
+                    if ARCHIVE_CACHE:
+                        archive_cache.save(store, self.xml_path)
                 
-                # 正则过滤
-                if self._is_effective(text):
-                    self.raw_texts.append(text)
-                    count_valid += 1
+                texts = store.danmaku_texts()
+                count_total = rec['items'] = len(texts)
+            
+            # 正则过滤（合并正则，批量判定）
+            with self.instrument.stage('filter', items=count_total):
+                mask = self.filter.filter_mask(texts)
+                self.raw_texts = [t for t, ok in zip(texts, mask) if ok]
+                self.raw_times = store.danmaku['timestamp'][np.array(mask, dtype=bool)]
+            count_valid = len(self.raw_texts)
             
             print(f"数据加载完成。总弹幕: {count_total}, 有效保留: {count_valid}")
+            self.filter.print_stats()
+            self.instrument.add_metrics('filter', self.filter.report())
             
         except Exception as e:
             print(f"读取XML出错: {e}")
@@ -82,60 +274,103 @@ class BiliDanmakuWordCloud:
 
     def _is_effective(self, text):
         """正则过滤逻辑"""
-        if not text: return False
-        for pattern in self.regex_list:
-            if pattern.search(text):
-                return False
-        return True
+        return self.filter.is_effective(text)
 
     def process_text(self):
         """分词与二次过滤 (参考脚本2逻辑)"""
         print("正在进行分词处理...")
         
-        # 加载自定义词典
-        if os.path.exists(USER_DICT_PATH):
-            jieba.load_userdict(USER_DICT_PATH)
-            print("已加载自定义词典。")
-
-        stopwords = self.load_stopwords()
+        # 相同文本只分词一次，按出现次数加权；按首次出现的顺序排列，保证词频表顺序与逐条分词一致
+        items = list(Counter(self.raw_texts).items())
+        if NEAR_DUP_COLLAPSE:
+            items = self._collapse_near_duplicates(items)
+        print(f"共 {len(self.raw_texts)} 条弹幕，去重后 {len(items)} 条待分词。")
         
-        # 合并文本进行分词 (也可以逐条分词，这里选择逐条处理以便过滤)
-        # 如果数据量巨大，可以考虑多进程，但一般弹幕量级单线程即可
-        
-        all_words = []
-        
-        for text in self.raw_texts:
-            
-            words = jieba.lcut(text)
-            for w in words:
-                # 过滤逻辑：非停用词 且 长度>1 (去除单字)
-                if w not in stopwords and len(w) > 1 and w.strip() != '':
-                    all_words.append(w)
+        with self.instrument.stage('process_text', items=len(self.raw_texts)):
+            # 加载主词典与自定义词典（经缓存）；多进程时也先在主进程加载，fork 出的工作进程直接继承
+            import jieba_cache
+            if jieba_cache.prepare(USER_DICT_PATH, JIEBA_DICT_CACHE):
+                print("已加载自定义词典。")
+            if RENDER_WINDOW_SECONDS or RENDER_RANGES:
+                c = self._build_cube(items)
+            elif self.workers <= 1:
+                c = count_words(items, self.load_stopwords())
+            else:
+                c = self._count_words_parallel(items)
+        self.instrument.add_metrics('segmentation', {'texts': len(self.raw_texts), 'distinct_texts': len(items),
+                                                     'distinct_words': len(c), 'workers': self.workers})
         
-        self.clean_words = all_words
-        print(f"分词完成，有效词汇量: {len(self.clean_words)}")
+        self.word_counts = c
+        print(f"分词完成，有效词汇量: {sum(c.values())}")
 
         # 打印一下Top30方便调试
-        c = Counter(self.clean_words)
         print("Top 30 高频词预览:")
         print(c.most_common(30))
         return c
 
+    def _collapse_near_duplicates(self, items):
+        """把 (文本, 次数) 按近重复簇合并为 (代表文本, 簇内总次数)，按代表首次出现的顺序排列"""
+        collapser = NearDuplicateCollapser(NEAR_DUP_JACCARD, NEAR_DUP_LENGTH_RATIO)
+        texts = [t for t, _ in items]
+        with self.instrument.stage('near_dup', items=len(self.raw_texts)):
+            rep = collapser.collapse(texts, [n for _, n in items])
+        self.representative = {t: texts[r] for t, r in zip(texts, rep.tolist())}
+        merged = Counter()
+        for (text, n), r in zip(items, rep.tolist()):
+            merged[texts[r]] += n
+        print(collapser.summary())
+        self.instrument.add_metrics('near_dup', collapser.report())
+        return list(merged.items())
+
+    def _seg_pool(self):
+        return multiprocessing.Pool(self.workers, initializer=_init_seg_worker,
+                                    initargs=(USER_DICT_PATH, STOPWORDS_PATH, JIEBA_DICT_CACHE))
+
+    def _count_words_parallel(self, items):
+        """按块分发到进程池分词，各进程返回局部 Counter，按块顺序合并"""
+        chunks = [items[i:i + self.chunksize] for i in range(0, len(items), self.chunksize)]
+        c = Counter()
+        with self._seg_pool() as pool:
+            for i, part in enumerate(pool.imap(_count_words_worker, chunks)):
+                c.update(part)
+                print(f"分词进度 {i + 1}/{len(chunks)} 块（{self.workers} 进程）")
+        return c
+
+    def _segment_texts(self, texts):
+        """逐条分词，返回与 texts 对应的词列表；多进程时按块分发"""
+        if self.workers <= 1:
+            stopwords = self.load_stopwords()
+            return [segment(text, stopwords) for text in texts]
+        chunks = [texts[i:i + self.chunksize] for i in range(0, len(texts), self.chunksize)]
+        words = []
+        with self._seg_pool() as pool:
+            for i, part in enumerate(pool.imap(_segment_worker, chunks)):
+                words.extend(part)
+                print(f"分词进度 {i + 1}/{len(chunks)} 块（{self.workers} 进程）")
+        return words
+
+    def _build_cube(self, items):
+        """每种（代表）文本分词一次，连同每条弹幕的时间戳建立词频立方体，返回全场词频"""
+        texts = [t for t, _ in items]
+        words = self._segment_texts(texts)
+        with self.instrument.stage('word_cube', items=len(self.raw_texts)):
+            index = {t: i for i, t in enumerate(texts)}
+            rep = self.representative
+            text_ids = np.array([index[rep.get(t, t)] for t in self.raw_texts], dtype=np.int64)
+            step = WORD_CUBE_STEP
+            if RENDER_WINDOW_SECONDS:
+                step = math.gcd(step, int(RENDER_WINDOW_SECONDS))
+            self.cube = WordCube.build(self.raw_times, text_ids, words, step)
+        print(f"词频立方体：{self.cube.n_buckets} 个 {step} 秒分桶，{len(self.cube.words)} 个词，"
+              f"{len(self.cube.keys)} 个非零项。")
+        return self.cube.totals()
+
     def extract_colors_from_image(self, image_path, num_colors=100):
-        """从图片中提取颜色集合（采样而非按位置映射）"""
+        """从图片中提取颜色集合（采样而非按位置映射）；降采样像素经 PALETTE_CACHE 缓存，每次运行重新随机抽取"""
         try:
-            from PIL import Image
-            img = Image.open(image_path).convert('RGB')
-            img_array = np.array(img)
-            
-            # 降采样以加快速度
-            h, w = img_array.shape[:2]
-            sample_h = max(1, h // 20)
-            sample_w = max(1, w // 20)
-            sampled = img_array[::sample_h, ::sample_w]
+            pixels = load_palette_pixels(image_path, PALETTE_CACHE)
             
-            # 扁平化并随机采样
-            pixels = sampled.reshape(-1, 3)
+            # 随机采样
             if len(pixels) > num_colors:
                 indices = np.random.choice(len(pixels), num_colors, replace=False)
                 colors = pixels[indices]
@@ -143,7 +378,7 @@ class BiliDanmakuWordCloud:
                 colors = pixels
             
             # 转换为RGB元组列表
-            color_list = [tuple(color) for color in colors]
+            color_list = [tuple(color) for color in colors.tolist()]
             return color_list
         except Exception as e:
             print(f"提取颜色失败: {e}")
@@ -151,64 +386,96 @@ class BiliDanmakuWordCloud:
 
     def create_random_color_func(self, color_list):
         """创建随机颜色函数"""
-        if not color_list:
-            return None
-        
-        def random_color_func(word=None, font_size=None, position=None, orientation=None, 
-                            font_path=None, random_state=None):
-            """随机返回颜色列表中的一个颜色"""
-            color = random.choice(color_list)
-            return 'rgb({},{},{})'.format(color[0], color[1], color[2])
-        
-        return random_color_func
+        return random_color_func(color_list)
+
+    def segment_word_counts(self):
+        """分段词云的词频，返回 [(文件名, {词: 次数})]：先按 RENDER_WINDOW_SECONDS 切段，再加上 RENDER_RANGES 中的各时间段"""
+        cube = self.cube
+        segments = []
+        if RENDER_WINDOW_SECONDS:
+            for start, counts in cube.windows(int(RENDER_WINDOW_SECONDS), RENDER_TOP_N):
+                stamp = time.strftime('%Y%m%d_%H%M%S', time.localtime(start))
+                segments.append((f"wordcloud_{RENDER_WINDOW_SECONDS}s_{stamp}.png", counts))
+        for start, end in RENDER_RANGES:
+            start_ts = parse_time(str(start), cube.origin)
+            end_ts = parse_time(str(end), start_ts)
+            counts = cube.top(start_ts, end_ts, RENDER_TOP_N)
+            if not counts:
+                print(f"时间段 {start} - {end} 内没有词，跳过。")
+                continue
+            stamp = time.strftime('%Y%m%d_%H%M%S', time.localtime(start_ts))
+            segments.append((f"wordcloud_{stamp}-{time.strftime('%H%M%S', time.localtime(end_ts))}.png", counts))
+        return segments
+
+    def _render_job(self, filename, word_counts, size, colors):
+        width, height = size
+        return {'path': os.path.join(OUTPUT_FOLDER, filename),
+                'frequencies': prune_frequencies(word_counts, RENDER_TOP_N), 'max_words': RENDER_TOP_N,
+                'width': width, 'height': height, 'scale': RENDER_SCALE, 'font_path': FONT_PATH, 'colors': colors}
+
+    def render(self, jobs):
+        """渲染全部词云：RENDER_WORKERS > 1 且多于一张时在进程池中并行（工作进程只用 Agg 后端），返回输出路径列表"""
+        workers = min(RENDER_WORKERS, len(jobs))
+        if workers <= 1:
+            results = map(render_cloud, jobs)
+        else:
+            pool = multiprocessing.Pool(workers, initializer=_init_render_worker)
+            results = pool.imap(render_cloud, jobs)
+        paths = []
+        try:
+            for path, seconds in results:
+                print(f"词云已保存至: {path}（{seconds:.2f} 秒）")
+                paths.append(path)
+        finally:
+            if workers > 1:
+                pool.close()
+                pool.join()
+        return paths
 
     def generate_wordcloud(self, word_counts):
-        """生成词云图 (参考脚本2逻辑)"""
+        """生成词云图 (参考脚本2逻辑)：每个 RENDER_SIZES 尺寸一张，设置了 RENDER_WINDOW_SECONDS / RENDER_RANGES 时另按各时间段各一张"""
+        if HEADLESS:
+            use_headless_backend()
         print("正在生成词云图...")
 
-        # 配置词云基础参数
-        wc_params = {
-            "font_path": FONT_PATH,
-            "background_color": None,  # 【关键1】背景色设为 None
-            "mode": "RGBA",             # 【关键2】模式设为 RGBA 以支持透明
-            "stopwords": set(),
-            "width": 1920,              # 设置图像宽度
-            "height": 1080,             # 设置图像高度
-            "max_words": 300,
-            "min_word_length": 2,
-            "include_numbers": True
-        }
-        
-        # 创建词云对象
-        wc = WordCloud(**wc_params)
-        # 根据词频生成
-        wc.generate_from_frequencies(word_counts)
-
-        # 如果提供了颜色图片，则使用其颜色随机着色
-        if os.path.exists(COLOR_IMAGE_PATH):
-            try:
-                # 从图片中提取颜色（随机采样而非按位置映射）
+        with self.instrument.stage('generate_wordcloud', items=len(word_counts)) as rec:
+            # 如果提供了颜色图片，则使用其颜色随机着色（所有图共用同一组颜色）
+            colors = []
+            if os.path.exists(COLOR_IMAGE_PATH):
                 colors = self.extract_colors_from_image(COLOR_IMAGE_PATH, num_colors=50)
                 if colors:
-                    # 使用随机颜色函数重新着色
-                    color_func = self.create_random_color_func(colors)
-                    wc.recolor(color_func=color_func)
-                    print(f"已应用颜色图片的着色（从图片中随机提取 {len(colors)} 种颜色）。")
+                    print(f"将应用颜色图片的着色（从图片中随机提取 {len(colors)} 种颜色）。")
                 else:
                     print("颜色提取失败，使用默认颜色。")
-            except Exception as e:
-                print(f"加载颜色图片失败: {e}")
 
-        # 保存文件
-        output_filename = os.path.join(OUTPUT_FOLDER, "wordcloud_result.png")
-        wc.to_file(output_filename)
-        print(f"词云已保存至: {output_filename}")
+            jobs = []
+            for i, size in enumerate(RENDER_SIZES):
+                filename = "wordcloud_result.png" if i == 0 else f"wordcloud_result_{size[0]}x{size[1]}.png"
+                jobs.append(self._render_job(filename, word_counts, size, colors))
+            if self.cube is not None:
+                with self.instrument.stage('segment_counts', items=len(self.raw_texts)):
+                    segments = self.segment_word_counts()
+                for filename, counts in segments:
+                    jobs.append(self._render_job(filename, counts, RENDER_SIZES[0], colors))
+            rec['images'] = len(jobs)
+            paths = self.render(jobs)
+
+        if HEADLESS:
+            return paths
 
         # 展示
+        import matplotlib.pyplot as plt
         plt.figure(figsize=(10, 10))
-        plt.imshow(wc, interpolation='bilinear')
+        plt.imshow(plt.imread(paths[0]), interpolation='bilinear')
         plt.axis("off")
         plt.show()
+        return paths
+
+    def write_run_report(self):
+        """运行报告：阶段耗时与过滤/分词统计，写到词云图旁边"""
+        self.instrument.add_metrics('input', {'xml_file': self.xml_path, 'effective': len(self.raw_texts)})
+        print(self.instrument.summary())
+        self.instrument.write(os.path.join(OUTPUT_FOLDER, 'run_report.json'))
 
 if __name__ == "__main__":
     # 检查 regex 库是否安装 (因为使用了 \p{P})
@@ -225,4 +492,7 @@ if __name__ == "__main__":
     if counts:
         generator.generate_wordcloud(counts)
     else:
-        print("没有提取到足够的词汇，无法生成词云。")
\ No newline at end of file
+        print("没有提取到足够的词汇，无法生成词云。")
+
+    if RUN_REPORT:
+        generator.write_run_report()
\ No newline at end of file